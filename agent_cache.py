@@ -0,0 +1,94 @@
+import os, json, time, hashlib
+from contextlib import contextmanager
+
+from catalog import DATA_DIR, open_db
+
+AGENT_CACHE_DB = os.path.join(DATA_DIR, "agent_cache.db")
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# how long an agent's section stays valid, by how fast its sources change
+TTLS = {
+    "financials": 14 * DAY,  # annual and quarterly filings
+    "market": 3 * DAY,
+    "news": 6 * HOUR,
+    "sentiment": 6 * HOUR,
+    "synthesis": 14 * DAY,  # keyed on its input sections, so it only ages with them
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key        TEXT PRIMARY KEY,
+    section    TEXT NOT NULL,
+    company    TEXT NOT NULL,
+    params     TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    sources    TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_company ON results (company COLLATE NOCASE);
+"""
+
+
+@contextmanager
+def db():
+    conn = open_db(AGENT_CACHE_DB, SCHEMA)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def cache_key(section, params):
+    """Stable key of a section for the given inputs, case and whitespace insensitive."""
+    normalized = {k: " ".join(str(v).lower().split()) if v is not None else None for k, v in params.items()}
+    blob = json.dumps([section, normalized], sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get(section, params, max_age=None):
+    """Cached section younger than max_age seconds (its TTL by default) as a dict
+    with content, sources and created_at, None otherwise."""
+    max_age = TTLS.get(section, 0) if max_age is None else max_age
+    with db() as conn:
+        row = conn.execute(
+            "SELECT content, sources, created_at FROM results WHERE key = ?", (cache_key(section, params),)
+        ).fetchone()
+    if row and time.time() - row["created_at"] < max_age:
+        return {"content": row["content"], "sources": json.loads(row["sources"]), "created_at": row["created_at"]}
+    return None
+
+
+def put(section, params, content, sources=()):
+    with db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                cache_key(section, params), section, params.get("company_name") or "",
+                json.dumps(params, sort_keys=True), content, json.dumps(list(sources)), time.time(),
+            ),
+        )
+
+
+def invalidate(company, sections=None):
+    """Drop cached sections of a company, all of them by default. Returns the number dropped."""
+    clauses, values = ["company = ? COLLATE NOCASE"], [company.strip()]
+    if sections:
+        clauses.append(f"section IN ({','.join('?' * len(sections))})")
+        values.extend(sections)
+    with db() as conn:
+        return conn.execute(f"DELETE FROM results WHERE {' AND '.join(clauses)}", values).rowcount
+
+
+def prune():
+    """Delete entries past their section's TTL."""
+    now = time.time()
+    with db() as conn:
+        removed = 0
+        for section, ttl in TTLS.items():
+            removed += conn.execute(
+                "DELETE FROM results WHERE section = ? AND created_at < ?", (section, now - ttl)
+            ).rowcount
+        return removed
@@ -1,9 +1,78 @@
+import os
+import time
 import logging
 import asyncio
+import hashlib
 from gpt_researcher import GPTResearcher
+import tenk
+import vectors
+import metrics
+import ratelimit
+import agent_cache
+import compress
 from dotenv import load_dotenv
 load_dotenv()
 
+# per agent wall clock budget in seconds
+AGENT_TIMEOUT = 600
+
+# research agents running at once across every job and batch of this process, the rest wait for a slot
+MAX_CONCURRENT_AGENTS = int(os.getenv("MARS_MAX_AGENTS", "8"))
+_agent_slots = None
+
+def agent_slots():
+    global _agent_slots
+    if _agent_slots is None:
+        # created lazily so it binds to the running event loop
+        _agent_slots = asyncio.Semaphore(MAX_CONCURRENT_AGENTS)
+    return _agent_slots
+
+# what the financial agent looks for in local 10-K filings
+FINANCIAL_TOPICS = [
+    "revenue trend and growth by segment",
+    "profitability, gross and operating margins, net income",
+    "operating cash flow, free cash flow and capital expenditure",
+    "balance sheet, liquidity, debt and leverage",
+    "red flags, material risks, impairments and going concern",
+]
+
+def local_filing_context(company):
+    """Most relevant 10-K passages for the financial agent, "" when nothing is stored locally."""
+    try:
+        return vectors.relevant_context(company, FINANCIAL_TOPICS)
+    except Exception:
+        # no embeddings available, fall back to the leading part of each Item
+        logging.exception("vector search failed for %s", company)
+        return tenk.filing_context(company)
+
+# report attribute -> agent method, these four are independent of each other
+RESEARCH_AGENTS = {
+    "financials": "financial_research",
+    "news": "news_intelligence",
+    "sentiment": "sentiment_analysis",
+    "market": "market_context",
+}
+
+# the inputs each section's prompt uses, its output is cached under them
+CACHE_INPUTS = {
+    "financials": ("company_name",),
+    "news": ("company_name", "time_horizon"),
+    "sentiment": ("company_name", "time_horizon"),
+    "market": ("company_name", "industry_focus", "geo_focus"),
+}
+
+class ProgressSink:
+    """Takes the place of the websocket GPT Researcher streams its logs to, each log line becomes a progress event."""
+
+    def __init__(self, research, section):
+        self.research = research
+        self.section = section
+
+    async def send_json(self, data):
+        # the report text is streamed here too, only log lines are progress
+        if data.get("type") == "logs":
+            await self.research._emit("agent_progress", self.section, message=data.get("output") or data.get("content"))
+
 class CompanyResearcher:
     def __init__(self):
         #inputs
@@ -19,10 +88,155 @@ class CompanyResearcher:
         self.market = ""
         self.synthesis = ""
 
+        # sections that failed or timed out
+        self.gaps = []
+
+        # sections reused from agent_cache, set use_cache to False to rerun everything
+        self.use_cache = True
+        self.cached = []
+
+        # per section source urls and generation time, kept in the run's artifact
+        self.sources = {}
+        self.generated_at = {}
+
+        # per section wall time, outcome and GPT Researcher cost in USD, for traces and /metrics
+        self.timings = {}
+        self.costs = {}
+        self.started_at = time.time()
+
+        # token counts of the synthesis input before and after compress.py, for traces
+        self.compression = {}
+
+        # async callback receiving progress events, e.g. to stream a research job
+        self.on_progress = None
+
         #notes
         self.notes = "Do not use any code blocks in your responses."
 
+    def _cache_params(self, section):
+        if section == "synthesis":
+            # depends on everything, but only changes when one of its input sections does.
+            # The sections go in as hashes, the params column would hold all four texts otherwise
+            params = {name: getattr(self, name) for name in ("company_name", "industry_focus", "geo_focus", "time_horizon")}
+            params.update({name: hashlib.sha256(getattr(self, name).encode("utf-8")).hexdigest() for name in RESEARCH_AGENTS})
+            # a different budget compresses the sections into a different prompt
+            params["synthesis_tokens"] = compress.SYNTHESIS_TOKEN_BUDGET
+            return params
+        return {name: getattr(self, name) for name in CACHE_INPUTS[section]}
+
+    async def _cached(self, section):
+        """Fresh cached output of a section, also set on self, None when the agent has to run."""
+        if not self.use_cache:
+            return None
+        entry = await asyncio.to_thread(agent_cache.get, section, self._cache_params(section))
+        if entry is None:
+            return None
+        setattr(self, section, entry["content"])
+        self.sources[section] = entry["sources"]
+        self.generated_at[section] = entry["created_at"]
+        self.cached.append(section)
+        return entry["content"]
+
+    async def _store(self, section, content):
+        self.generated_at[section] = time.time()
+        if content:
+            await asyncio.to_thread(
+                agent_cache.put, section, self._cache_params(section), content, self.sources.get(section, [])
+            )
+
+    async def _emit(self, event, section, **data):
+        if self.on_progress is None:
+            return
+        try:
+            await self.on_progress({"event": event, "section": section, "at": time.time(), **data})
+        except Exception:
+            # progress reporting never fails a research run
+            logging.exception("progress callback failed for %s", section)
+
+    async def _record(self, section, started, outcome, **data):
+        seconds = time.perf_counter() - started
+        cost = self.costs.get(section) or 0
+        self.timings[section] = {"seconds": round(seconds, 3), "outcome": outcome, "cost_usd": cost}
+        metrics.observe("mars_agent_seconds", seconds, agent=section, outcome=outcome)
+        if cost:
+            metrics.inc("mars_agent_cost_usd_total", cost, agent=section)
+        await self._emit("agent_done", section, outcome=outcome, seconds=round(seconds, 3), **data)
+
+    async def _run_agent(self, section, timeout):
+        """Run one agent unless its section is cached, turning a failure into a marked gap."""
+        started = time.perf_counter()
+        cached = await self._cached(section)
+        if cached is not None:
+            await self._record(section, started, "cached")
+            return cached
+        try:
+            # the timeout starts once the agent has a slot
+            async with agent_slots():
+                await self._emit("agent_started", section)
+                report = await asyncio.wait_for(getattr(self, RESEARCH_AGENTS[section])(), timeout)
+            await self._store(section, report)
+            if section in self.gaps:
+                # filled in by a refresh of an earlier run
+                self.gaps.remove(section)
+            await self._record(section, started, "ok")
+            return report
+        except asyncio.TimeoutError:
+            reason = f"timed out after {timeout}s"
+            outcome = "timeout"
+        except Exception as e:
+            logging.exception("%s agent failed for %s", section, self.company_name)
+            reason = f"{type(e).__name__}: {e}"
+            outcome = "error"
+
+        gap = f"> ⚠️ This section could not be generated ({reason})."
+        setattr(self, section, gap)
+        # a refresh of a run that already had this gap fails it again
+        if section not in self.gaps:
+            self.gaps.append(section)
+        await self._record(section, started, outcome, reason=reason)
+        return gap
+
+    # GPT Researcher calls its providers itself, each phase first waits for its usual share of the quota
+    async def _conduct(self, researcher):
+        await ratelimit.reserve_phase("conduct_research")
+        await researcher.conduct_research()
+
+    async def _write(self, researcher, **kwargs):
+        await ratelimit.reserve_phase("write_report")
+        return await researcher.write_report(**kwargs)
+
+    # Agents 1-4 run concurrently, synthesis should only start after this returns
+    # sections limits the run to some of them, the others keep their current content
+    async def run_research_agents(self, timeout=AGENT_TIMEOUT, concurrent=True, sections=None):
+        sections = [s for s in RESEARCH_AGENTS if sections is None or s in sections]
+        if not concurrent:
+            return [await self._run_agent(section, timeout) for section in sections]
+        return await asyncio.gather(*(self._run_agent(section, timeout) for section in sections))
+
+    # Synthesis is reused when none of the four sections changed
+    async def run_synthesis(self):
+        started = time.perf_counter()
+        cached = await self._cached("synthesis")
+        if cached is not None:
+            await self._record("synthesis", started, "cached")
+            return cached
+        try:
+            async with agent_slots():
+                await self._emit("agent_started", "synthesis")
+                report = await self.insight_synthesis()
+        except Exception as e:
+            await self._record("synthesis", started, "error", reason=f"{type(e).__name__}: {e}")
+            raise
+        await self._record("synthesis", started, "ok", compression=self.compression)
+        self.timings["synthesis"]["compression"] = self.compression
+        if self.gaps:
+            self.generated_at["synthesis"] = time.time()
+        else:
+            await self._store("synthesis", report)
+        return report
+
     # Agent 1: Financial & Regulatory Research
+    # writes from the locally downloaded 10-K Items when fetch.py has them, web research otherwise
     async def financial_research(self):
         query = f"""
     Aanalyze the LAST 3 YEARS of financial info for {self.company_name}.
@@ -43,16 +257,23 @@ class CompanyResearcher:
 
     {self.notes}
     """
+        filings = await asyncio.to_thread(local_filing_context, self.company_name)
+
         researcher = GPTResearcher(query=query, 
                                    report_type="detailed_report",
-                                #  for local databank access but too much embeddings usage
-                                #  report_source="local", 
-                                   max_subtopics=1)
+                                   max_subtopics=1,
+                                   websocket=ProgressSink(self, "financials"))
 
-        await researcher.conduct_research()
-        report = await researcher.write_report()
+        if filings:
+            # passages picked from the cached 10-K embeddings, no web search needed
+            report = await self._write(researcher, ext_context=filings)
+        else:
+            await self._conduct(researcher)
+            report = await self._write(researcher)
 
         self.financials = report
+        self.sources["financials"] = researcher.get_source_urls()
+        self.costs["financials"] = researcher.get_costs()
 
         return report
 
@@ -76,12 +297,15 @@ class CompanyResearcher:
 
     {self.notes}
     """
-        researcher = GPTResearcher(query=query, report_type="detailed_report", max_subtopics=3)
+        researcher = GPTResearcher(query=query, report_type="detailed_report", max_subtopics=3,
+                                   websocket=ProgressSink(self, "news"))
 
-        await researcher.conduct_research()
-        report = await researcher.write_report()
+        await self._conduct(researcher)
+        report = await self._write(researcher)
 
         self.news = report
+        self.sources["news"] = researcher.get_source_urls()
+        self.costs["news"] = researcher.get_costs()
 
         return report
 
@@ -106,12 +330,15 @@ class CompanyResearcher:
 
     {self.notes}
     """
-        researcher = GPTResearcher(query=query, report_type="research_report", max_subtopics=1)
+        researcher = GPTResearcher(query=query, report_type="research_report", max_subtopics=1,
+                                   websocket=ProgressSink(self, "sentiment"))
 
-        await researcher.conduct_research()
-        report = await researcher.write_report()
+        await self._conduct(researcher)
+        report = await self._write(researcher)
 
         self.sentiment = report
+        self.sources["sentiment"] = researcher.get_source_urls()
+        self.costs["sentiment"] = researcher.get_costs()
 
         return report
 
@@ -134,18 +361,27 @@ class CompanyResearcher:
 
     {self.notes}
     """
-        researcher = GPTResearcher(query=query, report_type="outline_report", max_subtopics=0)
+        researcher = GPTResearcher(query=query, report_type="outline_report", max_subtopics=0,
+                                   websocket=ProgressSink(self, "market"))
 
-        await researcher.conduct_research()
-        report = await researcher.write_report()
+        await self._conduct(researcher)
+        report = await self._write(researcher)
 
         self.market = report
+        self.sources["market"] = researcher.get_source_urls()
+        self.costs["market"] = researcher.get_costs()
 
         return report
 
 
     # Agent 5: Insight Synthesis
+    # works from the four sections with cross-section repeats removed and cut to MARS_SYNTHESIS_TOKENS
     async def insight_synthesis(self):
+        sections, self.compression = await asyncio.to_thread(
+            compress.compress_sections, {name: getattr(self, name) for name in RESEARCH_AGENTS}
+        )
+        print(f"🗜️ Synthesis input for {self.company_name}: {self.compression['tokens_in']} → "
+              f"{self.compression['tokens_out']} tokens ({self.compression['duplicates']} repeated sentences removed)")
         query = f"""
     Use ONLY internal analysis. Give short bulleted insights.
 
@@ -156,16 +392,16 @@ class CompanyResearcher:
     Time Horizon: {self.time_horizon}
 
     === Financials ===
-    {self.financials}
+    {sections["financials"]}
 
     === News ===
-    {self.news}
+    {sections["news"]}
 
     === Sentiment ===
-    {self.sentiment}
+    {sections["sentiment"]}
 
     === Market ===
-    {self.market}
+    {sections["market"]}
 
     Tasks:
     - Connect insights across domains
@@ -173,11 +409,14 @@ class CompanyResearcher:
     - Highlight contradictions or hidden risks
     - Avoid repeating raw facts
     """
-        researcher = GPTResearcher(query=query, report_type="deep", max_subtopics=1)
+        researcher = GPTResearcher(query=query, report_type="deep", max_subtopics=1,
+                                   websocket=ProgressSink(self, "synthesis"))
 
-        await researcher.conduct_research()
-        report = await researcher.write_report()
+        await self._conduct(researcher)
+        report = await self._write(researcher)
 
         self.synthesis = report
+        self.sources["synthesis"] = researcher.get_source_urls()
+        self.costs["synthesis"] = researcher.get_costs()
 
         return report
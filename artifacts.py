@@ -0,0 +1,81 @@
+import os, re, json, time, uuid, glob
+from datetime import datetime, timezone
+
+from catalog import DATA_DIR
+from agents import CompanyResearcher
+
+# data/artifacts/<company>/<run id>.json, one file per research or refresh run
+ARTIFACT_DIR = os.path.join(DATA_DIR, "artifacts")
+
+SECTIONS = ("financials", "news", "sentiment", "market", "synthesis")
+PARAMS = ("company_name", "industry_focus", "geo_focus", "time_horizon")
+
+
+def company_dir(company):
+    slug = re.sub(r"[^a-z0-9]+", "-", company.lower()).strip("-") or "unnamed"
+    return os.path.join(ARTIFACT_DIR, slug)
+
+
+def save(research, report_file, parent=None, refreshed=None):
+    """Store a run's sections, parameters, timestamps and sources. Returns the artifact."""
+    now = time.time()
+    artifact = {
+        # sorts by creation time, microseconds keep back to back refreshes in order
+        "run_id": datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%dT%H%M%S%f") + "-" + uuid.uuid4().hex[:6],
+        "created_at": now,
+        "params": {name: getattr(research, name) for name in PARAMS},
+        "report": report_file,
+        "parent": parent,
+        "refreshed": refreshed,
+        "gaps": list(research.gaps),
+        "sections": {
+            name: {
+                "markdown": getattr(research, name),
+                "generated_at": research.generated_at.get(name),
+                "cached": name in research.cached,
+                "sources": list(research.sources.get(name, [])),
+            }
+            for name in SECTIONS
+        },
+    }
+
+    directory = company_dir(research.company_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{artifact['run_id']}.json")
+    # written under a temporary name so a crash never leaves a truncated artifact behind
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".part", path)
+    return artifact
+
+
+def history(company):
+    """Run ids of a company's artifacts, newest first."""
+    paths = glob.glob(os.path.join(company_dir(company), "*.json"))
+    return sorted((os.path.splitext(os.path.basename(p))[0] for p in paths), reverse=True)
+
+
+def load(company, run_id=None):
+    """A stored run, the latest one by default. None if there is none."""
+    run_id = run_id or next(iter(history(company)), None)
+    if not run_id:
+        return None
+    path = os.path.join(company_dir(company), f"{os.path.basename(run_id)}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def to_researcher(artifact):
+    """A CompanyResearcher holding a stored run's parameters and sections, ready to refresh or re-render."""
+    research = CompanyResearcher()
+    for name in PARAMS:
+        setattr(research, name, artifact["params"].get(name))
+    for name, section in artifact["sections"].items():
+        setattr(research, name, section["markdown"])
+        research.sources[name] = section["sources"]
+        research.generated_at[name] = section["generated_at"]
+    # gaps of the stored run stay gaps until their section is regenerated
+    research.gaps = list(artifact.get("gaps") or [])
+    return research
@@ -0,0 +1,216 @@
+"""Batch research over many companies, e.g. the whole CIKS universe of fetch.py.
+
+    python batch.py --all --horizon "last 12 months"
+    python batch.py --companies Apple Microsoft NVIDIA --max-age-days 3
+
+Every company runs as a normal deep research, their agents share the process
+wide MARS_MAX_AGENTS slots, so throughput is bound by provider quotas rather
+than by running companies one after another. Progress is checkpointed to
+data/batches/<batch id>.json after each company, and running the same batch
+again resumes it: companies finished or with a report younger than
+--max-age-days are skipped.
+"""
+import os, re, json, time, asyncio, hashlib, argparse, traceback
+from functools import partial
+from pathlib import Path
+
+import catalog
+import ratelimit
+from catalog import DATA_DIR
+from agents import MAX_CONCURRENT_AGENTS, RESEARCH_AGENTS
+from filingstore import write_atomic
+from fetch import CIKS
+from jobs import JOB_LOCK_TTL, Job, lock_name
+from state import state
+from tools import research_params, trigger_deep_research
+
+BATCH_DIR = os.path.join(DATA_DIR, "batches")
+
+# companies whose latest report is younger than this are skipped (days)
+MAX_REPORT_AGE_DAYS = float(os.getenv("MARS_BATCH_MAX_AGE_DAYS", "7"))
+
+# companies in flight at once: enough to keep every agent slot busy while earlier
+# companies get their synthesis, so finished companies are checkpointed steadily
+MAX_COMPANIES = MAX_CONCURRENT_AGENTS // len(RESEARCH_AGENTS) + 1
+
+# company states a resumed batch does not run again, while younger than its max age
+FINISHED = {"done", "fresh"}
+
+# a batch is run by one process at a time, its lock outlives a process that died by at most this (seconds)
+BATCH_LOCK_TTL = 24 * 3600
+
+
+def batch_id(companies, params):
+    """Same companies and parameters, same batch, which is what makes a rerun resume."""
+    key = json.dumps([sorted(c.lower() for c in companies), params], sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def batch_path(batch):
+    return Path(BATCH_DIR) / f"{batch}.json"
+
+
+def load(batch):
+    """Checkpoint of a batch, None if it never ran."""
+    path = batch_path(batch)
+    if not re.fullmatch(r"[0-9a-f]{12}", batch) or not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(record):
+    record["updated_at"] = time.time()
+    write_atomic(batch_path(record["batch_id"]), json.dumps(record, indent=1).encode("utf-8"))
+
+
+def list_batches():
+    """Summaries of every checkpointed batch, most recent first."""
+    records = [load(path.stem) for path in Path(BATCH_DIR).glob("*.json")]
+    return sorted((summary(r) for r in records if r), key=lambda r: r["updated_at"], reverse=True)
+
+
+def summary(record):
+    counts = {}
+    for entry in record["companies"].values():
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return {name: record[name] for name in ("batch_id", "status", "params", "created_at", "updated_at")} | {"counts": counts}
+
+
+def new_batch(companies, params, refresh=False, max_age_days=MAX_REPORT_AGE_DAYS):
+    """The checkpoint of this batch, resumed if it ran before, with every unfinished company pending."""
+    companies = list(dict.fromkeys(c.strip() for c in companies if c.strip()))
+    batch = batch_id(companies, params)
+    record = load(batch) or {
+        "batch_id": batch,
+        "params": params,
+        "created_at": time.time(),
+        "updated_at": time.time(),
+        "companies": {},
+    }
+    record.update(status="pending", refresh=refresh, max_age_days=max_age_days)
+    for company in companies:
+        entry = record["companies"].get(company)
+        if not entry or entry["status"] not in FINISHED or time.time() - entry["finished_at"] > max_age_days * 86400:
+            record["companies"][company] = {"status": "pending"}
+    return record
+
+
+def is_fresh(company, max_age_days):
+    report = catalog.get_report(company)
+    return bool(report) and time.time() - report["generated_at"] < max_age_days * 86400
+
+
+async def _progress(job, event):
+    job.publish(event)
+    if event["event"] == "agent_done":
+        await asyncio.to_thread(state.put_job, job.to_dict())
+
+
+async def run_company(record, company, lock):
+    """Research one company of a batch and checkpoint its outcome."""
+    entry = record["companies"][company]
+    args = {"company_name": company, **record["params"], "refresh": record["refresh"]}
+    if not record["refresh"] and await asyncio.to_thread(is_fresh, company, record["max_age_days"]):
+        entry.update(status="fresh", finished_at=time.time())
+    else:
+        # the lock and job record of a research job, so a batch never duplicates one
+        # started from chat and chat can follow the company at /jobs/{id}
+        job = Job(args)
+        job.id = f"batch-{record['batch_id']}-{job.id}"
+        name = lock_name(job.key)
+        holder = await asyncio.to_thread(state.acquire, name, job.id, JOB_LOCK_TTL)
+        if holder:
+            entry.update(status="running_elsewhere", job_id=holder)
+        else:
+            job.status, job.started_at = "running", time.time()
+            entry.update(status="running", job_id=job.id, started_at=job.started_at)
+            await asyncio.to_thread(state.put_job, job.to_dict())
+            try:
+                # behind chat turns and single research jobs for the same quota
+                with ratelimit.priority("batch"):
+                    job.result = await trigger_deep_research(args, progress=partial(_progress, job))
+                job.status, job.partial_report = "done", None
+                entry.update(status="done", result=job.result)
+            except Exception as e:
+                traceback.print_exc()
+                job.status, job.error = "failed", str(e)
+                entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+            finally:
+                job.finished_at = time.time()
+                entry.update(finished_at=job.finished_at, seconds=round(job.finished_at - job.started_at, 1))
+                await asyncio.to_thread(state.put_job, job.to_dict())
+                await asyncio.to_thread(state.release, name, job.id)
+
+    print(f"  {'✔' if entry['status'] in FINISHED else '✖'} {company}: {entry['status']}")
+    async with lock:
+        await asyncio.to_thread(save, record)
+
+
+async def run_batch(record, max_companies=MAX_COMPANIES):
+    """Run every unfinished company of a batch, returns the final checkpoint."""
+    owner = f"pid-{os.getpid()}"
+    holder = await asyncio.to_thread(state.acquire, f"batch:{record['batch_id']}", owner, BATCH_LOCK_TTL)
+    if holder:
+        print(f"🗂️ Batch {record['batch_id']} is already running ({holder})")
+        return load(record["batch_id"]) or record
+    try:
+        return await _run_batch(record, max_companies)
+    finally:
+        await asyncio.to_thread(state.release, f"batch:{record['batch_id']}", owner)
+
+
+async def _run_batch(record, max_companies):
+    pending = [c for c, entry in record["companies"].items() if entry["status"] not in FINISHED]
+    record["status"] = "running"
+    await asyncio.to_thread(save, record)
+    print(f"🗂️ Batch {record['batch_id']}: {len(pending)} of {len(record['companies'])} companies to research")
+
+    slots = asyncio.Semaphore(max_companies)
+    lock = asyncio.Lock()
+
+    async def run(company):
+        async with slots:
+            await run_company(record, company, lock)
+
+    await asyncio.gather(*(run(company) for company in pending))
+    record["status"] = "done" if all(e["status"] in FINISHED for e in record["companies"].values()) else "incomplete"
+    await asyncio.to_thread(save, record)
+    return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Deep research for many companies, resumable")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--companies", nargs="+", metavar="COMPANY", help="companies to research")
+    group.add_argument("--all", action="store_true", help="every company in fetch.CIKS")
+    parser.add_argument("--geo", help="geographic focus")
+    parser.add_argument("--industry", help="industry focus")
+    parser.add_argument("--horizon", help="time horizon, e.g. 'last 12 months'")
+    parser.add_argument("--max-age-days", type=float, default=MAX_REPORT_AGE_DAYS, help="skip companies with a newer report")
+    parser.add_argument("--refresh", action="store_true", help="research every company again, ignoring fresh reports and cached sections")
+    parser.add_argument("--max-companies", type=int, default=MAX_COMPANIES, help="companies in flight at once")
+    return parser.parse_args(argv)
+
+
+def batch_params(geo=None, industry=None, horizon=None):
+    """Research parameters shared by every company of a batch, defaults applied."""
+    params = research_params({"company_name": "", "geo_focus": geo, "industry_focus": industry, "time_horizon": horizon})
+    return {name: value for name, value in params.items() if name != "company_name"}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    companies = sorted(CIKS) if args.all else args.companies
+    record = new_batch(companies, batch_params(args.geo, args.industry, args.horizon), args.refresh, args.max_age_days)
+
+    started = time.time()
+    record = asyncio.run(run_batch(record, args.max_companies))
+    counts = summary(record)["counts"]
+    print(f"\nDone in {time.time() - started:.0f}s: " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) + ".")
+    if record["status"] != "done":
+        print(f"Run the same command again to retry the rest (batch {record['batch_id']}).")
+
+
+if __name__ == "__main__":
+    main()
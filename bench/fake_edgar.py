@@ -0,0 +1,73 @@
+"""Local stand-in for SEC EDGAR: submissions JSON and synthetic 10-K documents.
+
+Every CIK has one 10-K per year of YEARS. Documents carry the standard Item
+headings, so the whole fetch.py -> filingstore -> tenk pipeline runs on them.
+Point fetch.py at it with MARS_SEC_DATA_URL and MARS_SEC_ARCHIVES_URL.
+"""
+import json, hashlib
+
+from fastapi import FastAPI, Request, Response
+
+YEARS = ("2023", "2024", "2025")
+
+ITEMS = [
+    ("1", "Business"), ("1A", "Risk Factors"), ("2", "Properties"), ("3", "Legal Proceedings"),
+    ("7", "Management's Discussion and Analysis"), ("7A", "Market Risk"),
+    ("8", "Financial Statements and Supplementary Data"), ("9A", "Controls and Procedures"),
+]
+
+PARAGRAPH = (
+    "Revenue increased compared with the prior year, driven by higher volumes in our largest segment "
+    "and favourable pricing, partly offset by currency headwinds and higher operating expenses. "
+)
+
+
+def accession(cik, year):
+    return f"{int(cik):010d}-{year[2:]}-{int(cik) % 900000 + 100000:06d}"
+
+
+def submissions(cik):
+    years = sorted(YEARS, reverse=True)
+    return {
+        "cik": cik,
+        "name": f"Company {cik}",
+        "filings": {
+            "recent": {
+                "form": ["10-K"] * len(years),
+                "accessionNumber": [accession(cik, y) for y in years],
+                "filingDate": [f"{y}-02-15" for y in years],
+                "primaryDocument": [f"form10k-{y}.htm" for y in years],
+            },
+            "files": [],
+        },
+    }
+
+
+def document(cik, name, size):
+    """A 10-K of roughly size bytes, different for every company and year."""
+    body = []
+    per_item = max(size // len(ITEMS) // len(PARAGRAPH), 1)
+    for number, title in ITEMS:
+        body.append(f"<p><b>Item {number}. {title}</b></p>")
+        body.extend(f"<p>{PARAGRAPH}Company {cik}, {name}, paragraph {n}.</p>" for n in range(per_item))
+    return f"<html><head><title>{name}</title></head><body>{''.join(body)}</body></html>".encode("utf-8")
+
+
+def create_app(document_size=400_000):
+    app = FastAPI()
+
+    @app.get("/submissions/CIK{cik}.json")
+    async def get_submissions(cik: str, request: Request):
+        data = submissions(cik)
+        etag = '"' + hashlib.sha256(repr(data).encode()).hexdigest()[:16] + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response = Response(content=json.dumps(data), media_type="application/json")
+        response.headers["ETag"] = etag
+        return response
+
+    @app.get("/Archives/edgar/data/{cik}/{acc}/{name}")
+    async def get_document(cik: str, acc: str, name: str):
+        return Response(content=document(cik, name, document_size), media_type="text/html")
+
+    return app
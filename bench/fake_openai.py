@@ -0,0 +1,98 @@
+"""Local stand-in for the OpenAI chat completions and embeddings API.
+
+Answers with a fixed latency and a scripted tool call, so /chat can be
+measured without network access or API cost. Point the server at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import json, time, asyncio, hashlib
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+EMBED_DIM = 1536
+
+
+def usage(messages, completion):
+    prompt = sum(len(json.dumps(m)) for m in messages) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def create_app(latency=0.05, token_latency=0.002, script=None, answer="Here is what I found. " * 20):
+    """App that calls the tools in script on a user's message, then answers.
+
+    latency is the time to the first token, token_latency the gap between
+    streamed chunks. script is a list of (tool name, arguments) called together
+    in the first iteration of every turn.
+    """
+    script = script if script is not None else [("list_existing_researches", {})]
+    app = FastAPI()
+
+    def reply(messages):
+        """(content, tool calls) for the next assistant message."""
+        if messages[-1]["role"] == "user" and script:
+            return None, [
+                {"id": f"call_{n}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+                for n, (name, args) in enumerate(script)
+            ]
+        return answer, None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body["messages"]
+        content, tool_calls = reply(messages) if body.get("tools") else ("Summary of the conversation so far.", None)
+        await asyncio.sleep(latency)
+
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "tool_calls": tool_calls},
+                    "finish_reason": "tool_calls" if tool_calls else "stop",
+                }],
+                "usage": usage(messages, len(content or "") // 4 + 10),
+            }
+
+        async def events():
+            def chunk(delta, finish=None):
+                data = {**base, "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                return f"data: {json.dumps(data)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                for n, call in enumerate(tool_calls):
+                    yield chunk({"tool_calls": [{"index": n, **call}]})
+            else:
+                for word in content.split(" "):
+                    await asyncio.sleep(token_latency)
+                    yield chunk({"content": word + " "})
+            yield chunk({}, "tool_calls" if tool_calls else "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                data = {**base, "object": "chat.completion.chunk", "choices": [],
+                        "usage": usage(messages, len(content or "") // 4 + 10)}
+                yield f"data: {json.dumps(data)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+        data = []
+        for n, text in enumerate(inputs):
+            # deterministic per text, so cached and fresh embeddings agree
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+            data.append({"object": "embedding", "index": n, "embedding": (vector / np.linalg.norm(vector)).tolist()})
+        tokens = sum(len(t) for t in inputs) // 4
+        return {"object": "list", "model": body["model"], "data": data,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
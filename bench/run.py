@@ -0,0 +1,309 @@
+"""Offline end-to-end benchmarks.
+
+    python bench/run.py                      # every benchmark
+    python bench/run.py chat fetch_research  # a subset
+    python bench/run.py --save-baseline      # later runs are compared with this one
+
+Runs in a scratch directory against local stand-ins: fake_openai.py for the
+OpenAI API, stub_researcher.py for GPT Researcher and fake_edgar.py for SEC
+EDGAR, so nothing leaves the machine and the numbers only depend on this code.
+
+Results are written to bench/results/<timestamp>.json and compared with
+bench/results/baseline.json, metrics more than REGRESSION_THRESHOLD worse are
+reported as regressions.
+"""
+import os, io, sys, json, time, socket, shutil, asyncio, argparse, platform, tempfile, threading, statistics
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_FILE = os.path.join(RESULTS_DIR, "baseline.json")
+sys.path.insert(0, REPO_DIR)
+
+import httpx
+import uvicorn
+
+import fake_edgar
+import fake_openai
+import stub_researcher
+
+# relative change that counts as a regression
+REGRESSION_THRESHOLD = 0.2
+
+CHAT_SESSIONS = (1, 8, 32)
+CHAT_TURNS = 3
+# goes through the model; CHAT_ROUTED is answered by router.py without it
+CHAT_MESSAGE = "What do our reports say about margins?"
+CHAT_ROUTED = "list reports"
+FETCH_COMPANIES = 8
+REPORT_SIZES = (20_000, 100_000, 500_000, 2_000_000)
+
+BENCHMARKS = ("chat", "research", "fetch", "fetch_research")
+
+
+def serve(app):
+    """Run an ASGI app on a free local port in a background thread, returns its base url."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 1),
+    }
+
+
+async def bench_chat(mars_url):
+    """/chat latency and throughput with N sessions chatting at once, plus streamed time to first token."""
+    results = {}
+    limits = httpx.Limits(max_connections=max(CHAT_SESSIONS) * 2)
+    async with httpx.AsyncClient(base_url=mars_url, timeout=120, limits=limits) as client:
+        for sessions in CHAT_SESSIONS:
+            latencies = []
+
+            async def user(n):
+                for turn in range(CHAT_TURNS):
+                    started = time.perf_counter()
+                    response = await client.post("/chat", json={
+                        "messages": [{"role": "user", "content": CHAT_MESSAGE}],
+                        "session_id": f"bench-{sessions}-{n}",
+                    })
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(n) for n in range(sessions)))
+            wall = time.perf_counter() - started
+            results[f"chat_{sessions}_sessions"] = {
+                **summarize(latencies), "turns_per_s": round(len(latencies) / wall, 2),
+            }
+
+        first_tokens = []
+        for n in range(10):
+            started = time.perf_counter()
+            async with client.stream("POST", "/chat", json={
+                "messages": [{"role": "user", "content": CHAT_MESSAGE}],
+                "session_id": f"bench-stream-{n}",
+                "stream": True,
+            }) as response:
+                async for line in response.aiter_lines():
+                    if line and json.loads(line)["type"] == "token":
+                        first_tokens.append(time.perf_counter() - started)
+                        break
+        results["chat_stream_first_token"] = summarize(first_tokens)
+
+        routed = []
+        for n in range(10):
+            started = time.perf_counter()
+            response = await client.post("/chat", json={
+                "messages": [{"role": "user", "content": CHAT_ROUTED}], "session_id": f"bench-routed-{n}",
+            })
+            response.raise_for_status()
+            routed.append(time.perf_counter() - started)
+        results["chat_routed"] = summarize(routed)
+    return results
+
+
+async def bench_research():
+    """Deep research wall time around stub agents: concurrent, sequential, cached and refresh."""
+    import tools
+
+    async def timed(coro):
+        started = time.perf_counter()
+        await coro
+        return round(time.perf_counter() - started, 3)
+
+    company = {"company_name": "Bench Corp", "industry_focus": "Benchmarks"}
+    return {
+        "research": {
+            "concurrent_s": await timed(tools.trigger_deep_research({**company, "refresh": True})),
+            "sequential_s": await timed(tools.trigger_deep_research({**company, "refresh": True, "sequential": True})),
+            "cached_s": await timed(tools.trigger_deep_research(company)),
+            "refresh_news_s": await timed(tools.refresh_research({**company, "sections": ["news"]})),
+        }
+    }
+
+
+def bench_fetch():
+    """fetch.py over the local EDGAR: a cold download of every filing, then a no-change refresh."""
+    import fetch, filingstore
+    # measure download, storage and Item extraction, not the SEC fair-access rate limit
+    fetch.limiter = fetch.TokenBucket(1000)
+    companies = sorted(fetch.CIKS)[:FETCH_COMPANIES]
+
+    timings = {}
+    for run in ("cold", "warm"):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            fetch.main(["--companies", *companies])
+        timings[run] = time.perf_counter() - started
+
+    usage = filingstore.usage()
+    return {
+        "fetch": {
+            "filings": usage["filings"],
+            "cold_s": round(timings["cold"], 3),
+            "filings_per_s": round(usage["filings"] / timings["cold"], 2),
+            "raw_mb_per_s": round(usage["raw_bytes"] / 1e6 / timings["cold"], 2),
+            "warm_s": round(timings["warm"], 3),
+            "compression_ratio": round(usage["raw_bytes"] / max(usage["stored_bytes"], 1), 2),
+        }
+    }
+
+
+def bench_fetch_research():
+    """fetch_research latency and result size as reports grow."""
+    import tools
+    from agents import CompanyResearcher
+    from report import save_html
+    from textutils import estimate_tokens
+
+    results = {}
+    for size in REPORT_SIZES:
+        research = CompanyResearcher()
+        research.company_name = f"Size{size // 1000}k"
+        for n, section in enumerate(("financials", "news", "sentiment", "market", "synthesis")):
+            lines = [
+                f"- Point {i}: segment {i % 7} revenue grew {i % 13}% while margin moved {i % 5} points in region {i % 11}."
+                for i in range(size // 5 // 90)
+            ]
+            setattr(research, section, f"## {section.title()} {n}\n\n" + "\n".join(lines))
+        filename = os.path.join(tools.REPORT_DIR, f"{research.company_name}.html")
+        with redirect_stdout(io.StringIO()):
+            save_html(research, filename)
+
+        args = {"report_name": os.path.basename(filename)}
+        timings = {}
+        for run, extra in (("cold", {}), ("warm", {}), ("question", {"question": "revenue growth in segment 3"})):
+            started = time.perf_counter()
+            result = tools.fetch_research({**args, **extra})
+            timings[run] = round((time.perf_counter() - started) * 1000, 1)
+        results[f"fetch_research_{size // 1000}kb"] = {
+            "html_kb": os.path.getsize(filename) // 1024,
+            "cold_ms": timings["cold"],
+            "warm_ms": timings["warm"],
+            "question_ms": timings["question"],
+            "result_tokens": estimate_tokens(result),
+        }
+    return results
+
+
+def lower_is_better(metric):
+    return metric.endswith(("_ms", "_s", "_tokens"))
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s") or metric == "compression_ratio"
+
+
+def compare(results, baseline):
+    """Metrics worse than the baseline by more than REGRESSION_THRESHOLD."""
+    regressions = []
+    for name, values in results.items():
+        for metric, value in values.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base:
+                continue
+            change = (value - base) / base
+            if higher_is_better(metric):
+                worse = change < -REGRESSION_THRESHOLD
+            else:
+                worse = lower_is_better(metric) and change > REGRESSION_THRESHOLD
+            if worse:
+                regressions.append(f"{name}.{metric}: {base} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks against local stand-ins")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK", help=f"any of {', '.join(BENCHMARKS)}, default all")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake OpenAI time to first token, seconds")
+    parser.add_argument("--agent-delay", type=float, default=0.2, help="stub GPT Researcher research time, seconds")
+    parser.add_argument("--save-baseline", action="store_true", help="also store the results as the new baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    benchmarks = args.benchmarks or list(BENCHMARKS)
+
+    os.environ["OPENAI_API_KEY"] = "bench"
+    # the stand-ins have no quota, measure the code rather than ratelimit.py waiting for one
+    for name in ("MARS_OPENAI_RPM", "MARS_OPENAI_TPM", "MARS_EMBEDDING_RPM", "MARS_EMBEDDING_TPM", "MARS_TAVILY_RPM"):
+        os.environ.setdefault(name, "100000000")
+    os.environ["OPENAI_BASE_URL"] = serve(fake_openai.create_app(latency=args.latency)) + "/v1"
+    edgar_url = serve(fake_edgar.create_app())
+    os.environ["MARS_SEC_DATA_URL"] = edgar_url
+    os.environ["MARS_SEC_ARCHIVES_URL"] = edgar_url + "/Archives/edgar/data"
+    stub_researcher.install(research_delay=args.agent_delay)
+
+    # the server keeps its state relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="mars-bench-")
+    os.chdir(workdir)
+    os.makedirs("reports")
+    os.makedirs("flow")
+    shutil.copy(os.path.join(REPO_DIR, "index.html"), "index.html")
+    print(f"🏁 Benchmarking {', '.join(benchmarks)} in {workdir}")
+
+    results = {}
+    try:
+        with redirect_stdout(io.StringIO()):
+            import server
+        if "chat" in benchmarks:
+            results.update(asyncio.run(bench_chat(serve(server.app))))
+        if "research" in benchmarks:
+            with redirect_stdout(io.StringIO()):
+                results.update(asyncio.run(bench_research()))
+        if "fetch" in benchmarks:
+            results.update(bench_fetch())
+        if "fetch_research" in benchmarks:
+            results.update(bench_fetch_research())
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, values in results.items():
+        print(f"  {name}: " + ", ".join(f"{k}={v}" for k, v in values.items()))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    record = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "options": {"latency": args.latency, "agent_delay": args.agent_delay},
+        "results": results,
+    }
+    path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=1)
+    print(f"💾 Results saved to {path}")
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"])
+        for line in regressions:
+            print(f"  ⚠️ Regression {line}")
+        if not regressions:
+            print("✅ No regressions against the baseline")
+    if args.save_baseline:
+        shutil.copy(path, BASELINE_FILE)
+        print(f"📌 Baseline updated: {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
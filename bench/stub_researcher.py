@@ -0,0 +1,42 @@
+"""Stand-in for the gpt_researcher package, installed before agents.py is imported.
+
+conduct_research sleeps instead of searching the web, write_report returns
+markdown of a fixed size. That leaves the orchestration, caching, rendering
+and indexing around the agents as what gets measured.
+"""
+import sys, types, asyncio
+
+PARAGRAPH = "The company grew revenue and margins while investing in new products. "
+
+
+class GPTResearcher:
+    research_delay = 0.2
+    write_delay = 0.05
+    report_chars = 6000
+
+    def __init__(self, query, report_type="research_report", **kwargs):
+        self.query = query
+        self.report_type = report_type
+
+    async def conduct_research(self):
+        await asyncio.sleep(self.research_delay)
+
+    async def write_report(self, ext_context=None, **kwargs):
+        await asyncio.sleep(self.write_delay)
+        paragraphs = ["- " + PARAGRAPH * 3 for _ in range(self.report_chars // (len(PARAGRAPH) * 3) + 1)]
+        return f"## {self.report_type}\n\n" + "\n".join(paragraphs)
+
+    def get_costs(self):
+        return 0.01
+
+    def get_source_urls(self):
+        return ["https://example.com/source"]
+
+
+def install(research_delay=0.2, write_delay=0.05, report_chars=6000):
+    GPTResearcher.research_delay = research_delay
+    GPTResearcher.write_delay = write_delay
+    GPTResearcher.report_chars = report_chars
+    module = types.ModuleType("gpt_researcher")
+    module.GPTResearcher = GPTResearcher
+    sys.modules["gpt_researcher"] = module
@@ -0,0 +1,214 @@
+import os, re, time, sqlite3, hashlib, threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# local state that is not served to the browser
+DATA_DIR = "data"
+CATALOG_DB = os.path.join(DATA_DIR, "catalog.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    filename     TEXT PRIMARY KEY,
+    company      TEXT NOT NULL,
+    industry     TEXT,
+    geo          TEXT,
+    time_horizon TEXT,
+    generated_at REAL NOT NULL,
+    size         INTEGER NOT NULL,
+    mtime        REAL NOT NULL,
+    etag         TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_company ON reports (company COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS reports_industry ON reports (industry COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS reports_generated ON reports (generated_at);
+"""
+
+# the subtitle block written by report.HTML_TEMPLATE
+SUBTITLE_FIELDS = {
+    "company": "Company",
+    "industry": "Industry",
+    "geo": "Geography",
+    "time_horizon": "Time Horizon",
+}
+
+
+# SQLite files whose schema this process has already set up
+_prepared = set()
+_prepare_lock = threading.Lock()
+
+
+def open_db(path, schema, migrate=None, timeout=30):
+    """Connection to a SQLite file. WAL mode, the schema and migrate(conn) are applied
+    on the first connection of the process only, later ones just open the file."""
+    path = os.path.abspath(path)
+    if path not in _prepared:
+        with _prepare_lock:
+            if path not in _prepared:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with sqlite3.connect(path, timeout=timeout) as conn:
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(schema)
+                    if migrate:
+                        migrate(conn)
+                conn.close()
+                _prepared.add(path)
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _migrate(conn):
+    # catalogs created before reports were served with ETags
+    if "etag" not in {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}:
+        conn.execute("ALTER TABLE reports ADD COLUMN etag TEXT")
+
+
+def connect():
+    return open_db(CATALOG_DB, SCHEMA, _migrate)
+
+
+@contextmanager
+def db():
+    """Connection that commits on success and is always closed."""
+    conn = connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _clean(value):
+    # save_html renders a missing focus as the string "None"
+    if value is None or value.strip() in ("", "None"):
+        return None
+    return value.strip()
+
+
+def content_etag(content):
+    """Strong validator of a report's bytes."""
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+def record_report(path, company, industry=None, geo=None, time_horizon=None, generated_at=None, etag=None):
+    """Insert or update the catalog row for a report file that was just written."""
+    stat = os.stat(path)
+    if etag is None:
+        with open(path, "rb") as f:
+            etag = content_etag(f.read())
+    with db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                os.path.basename(path), company, _clean(industry), _clean(geo), _clean(time_horizon),
+                generated_at or time.time(), stat.st_size, stat.st_mtime, etag,
+            ),
+        )
+
+
+def read_metadata(path):
+    """Recover report parameters from the subtitle of an existing report."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(8192)
+
+    meta = {}
+    for key, label in SUBTITLE_FIELDS.items():
+        match = re.search(rf"<b>{label}:</b>\s*([^<\n]*)", head)
+        meta[key] = _clean(match.group(1)) if match else None
+
+    if not meta["company"]:
+        meta["company"] = os.path.splitext(os.path.basename(path))[0]
+    return meta
+
+
+def reconcile(report_dir):
+    """Bring the catalog in line with the report directory, run once at startup."""
+    with db() as conn:
+        known = {row["filename"]: row for row in conn.execute("SELECT filename, size, mtime, etag FROM reports")}
+        seen = set()
+
+        for entry in os.scandir(report_dir):
+            # partial reports of running research are not listed
+            if not entry.name.endswith(".html") or entry.name.endswith(".partial.html"):
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            row = known.get(entry.name)
+            if row and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime and row["etag"]:
+                continue
+
+            meta = read_metadata(entry.path)
+            with open(entry.path, "rb") as f:
+                etag = content_etag(f.read())
+            conn.execute(
+                "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.name, meta["company"], meta["industry"], meta["geo"], meta["time_horizon"],
+                    stat.st_mtime, stat.st_size, stat.st_mtime, etag,
+                ),
+            )
+
+        stale = [(name,) for name in known if name not in seen]
+        conn.executemany("DELETE FROM reports WHERE filename = ?", stale)
+
+
+def parse_date(date):
+    """Timestamp of a YYYY-MM-DD date or full ISO timestamp, None when it is neither."""
+    try:
+        return datetime.fromisoformat(str(date).strip()).timestamp()
+    except ValueError:
+        return None
+
+
+def query_reports(company=None, industry=None, since=None, until=None, limit=20, offset=0):
+    """Return (rows, total) for reports matching the filters, newest first."""
+    clauses, params = [], []
+    if company:
+        clauses.append("company LIKE ?")
+        params.append(f"%{company}%")
+    if industry:
+        clauses.append("industry LIKE ?")
+        params.append(f"%{industry}%")
+    # an unreadable date filters nothing rather than failing the whole listing
+    if since and parse_date(since) is not None:
+        clauses.append("generated_at >= ?")
+        params.append(parse_date(since))
+    if until and parse_date(until) is not None:
+        clauses.append("generated_at < ?")
+        params.append(parse_date(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with db() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM reports {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM reports {where} ORDER BY generated_at DESC, filename LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+    return [dict(row) for row in rows], total
+
+
+def companies():
+    """Names of the companies with at least one report."""
+    with db() as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT company FROM reports")]
+
+
+def get_file(filename):
+    """Catalog row of exactly this report file, None if it is not catalogued."""
+    with db() as conn:
+        row = conn.execute("SELECT * FROM reports WHERE filename = ?", (filename,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_report(name):
+    """Look a report up by file name, falling back to the most recent one for a company."""
+    with db() as conn:
+        row = conn.execute("SELECT * FROM reports WHERE filename = ?", (name,)).fetchone()
+        if not row:
+            company = name[:-5] if name.endswith(".html") else name
+            row = conn.execute(
+                "SELECT * FROM reports WHERE company = ? COLLATE NOCASE ORDER BY generated_at DESC LIMIT 1",
+                (company,),
+            ).fetchone()
+    return dict(row) if row else None
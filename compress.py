@@ -0,0 +1,198 @@
+"""Local compression of the research sections before insight synthesis, no LLM calls.
+
+The four sections overlap a lot: the same revenue figure or headline shows up in
+financials, news and market. compress_sections drops near-duplicate sentences
+across sections with MinHash over word shingles, then, when the rest is still
+over the token budget, keeps the most salient sentences of each section in their
+original order.
+"""
+import os, re, math, hashlib
+
+import numpy as np
+
+from textutils import estimate_tokens, tokenize
+
+# token budget of the four sections together in the synthesis prompt
+SYNTHESIS_TOKEN_BUDGET = int(os.getenv("MARS_SYNTHESIS_TOKENS", "6000"))
+
+# estimated Jaccard similarity of word shingles above which two sentences say the same
+DUPLICATE_THRESHOLD = 0.6
+SHINGLE_SIZE = 3
+
+# MinHash signature of NUM_HASHES values, each the minimum of the shingle hashes xor one fixed mask
+NUM_HASHES = 64
+_MASKS = np.random.default_rng(25).integers(0, 2**63, NUM_HASHES, dtype=np.uint64)
+
+# salience bonus of a sentence carrying figures, capped at MAX_FIGURES of them
+FIGURE_WEIGHT = 0.5
+MAX_FIGURES = 3
+
+# no section is cut below this share of the budget, however small it is next to the others
+MIN_SECTION_SHARE = 0.5
+
+FIGURE_RE = re.compile(r"[$€£]?\d[\d,.]*\s?(?:%|percent|bn|billion|million|[mbk]\b)?", re.IGNORECASE)
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'($])")
+PREFIX_RE = re.compile(r"^\s*(?:[-*+>]|\d+[.)])\s+")
+HEADING_RE = re.compile(r"^\s*#{1,6}\s")
+TABLE_RULE_RE = re.compile(r"^\s*\|?[\s:|-]+\|[\s:|-]*$")
+
+
+class Unit:
+    """A sentence, or a table row, of a section line."""
+
+    def __init__(self, section, line, text):
+        self.section = section
+        self.line = line
+        self.text = text
+        self.tokens = tokenize(text)
+        self.cost = estimate_tokens(text)
+        self.figures = {f.strip().lower() for f in FIGURE_RE.findall(text)}
+        self.score = 0.0
+
+
+def split_units(section, text):
+    """(lines of the section, its units). Headings and table rules stay lines without units."""
+    lines, units = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        n = len(lines)
+        lines.append(line)
+        if HEADING_RE.match(line) or TABLE_RULE_RE.match(line):
+            continue
+        if line.lstrip().startswith("|"):
+            units.append(Unit(section, n, line.strip()))
+            continue
+        body = line[len(PREFIX_RE.match(line).group(0)):] if PREFIX_RE.match(line) else line
+        units.extend(Unit(section, n, s.strip()) for s in SENTENCE_RE.split(body.strip()) if s.strip())
+    return lines, units
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(tokens, size=SHINGLE_SIZE):
+    """MinHash signature of the word shingles of tokens, None when there are no tokens."""
+    if not tokens:
+        return None
+    shingles = {" ".join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))}
+    hashes = np.array([_hash(s) for s in shingles], dtype=np.uint64)
+    return (hashes[:, None] ^ _MASKS).min(axis=0)
+
+
+def score_units(units):
+    """Salience without a model: how central a sentence's terms are across the sections,
+    counting terms several sections mention more, plus a bonus for concrete figures."""
+    df, sections = {}, {}
+    for unit in units:
+        for term in set(unit.tokens):
+            df[term] = df.get(term, 0) + 1
+            sections.setdefault(term, set()).add(unit.section)
+
+    for unit in units:
+        terms = set(unit.tokens)
+        if terms:
+            unit.score = sum(math.log(1 + df[t]) * len(sections[t]) for t in terms) / math.sqrt(len(terms))
+    top = max((u.score for u in units), default=0) or 1
+    for unit in units:
+        count = min(len(unit.figures), MAX_FIGURES)
+        unit.score = unit.score / top + FIGURE_WEIGHT * count / MAX_FIGURES
+
+
+def dedupe(units):
+    """Units without near-duplicates, the most salient of each group of duplicates is kept.
+    A sentence with a figure none of its look-alikes has is a distinct fact and stays."""
+    signatures = np.empty((len(units), NUM_HASHES), dtype=np.uint64)
+    kept = []
+    for unit in sorted(units, key=lambda u: u.score, reverse=True):
+        signature = minhash(unit.tokens)
+        if signature is None:
+            continue
+        # estimated Jaccard similarity to every unit kept so far
+        similar = np.flatnonzero((signatures[:len(kept)] == signature).mean(axis=1) >= DUPLICATE_THRESHOLD)
+        if any(unit.figures <= kept[i].figures for i in similar):
+            continue
+        signatures[len(kept)] = signature
+        kept.append(unit)
+    return kept
+
+
+def select(units, budget):
+    """Most salient units within budget tokens. Each section first gets its share of the
+    budget, in proportion to its size but at least MIN_SECTION_SHARE of an even split,
+    whatever is left over goes to the best remaining units of any section."""
+    total = sum(u.cost for u in units)
+    if total <= budget:
+        return units
+    by_section = {}
+    for unit in units:
+        by_section.setdefault(unit.section, []).append(unit)
+    even = budget / len(by_section)
+
+    chosen, spent = set(), 0
+    for section, members in by_section.items():
+        share = max(budget * sum(u.cost for u in members) / total, MIN_SECTION_SHARE * even)
+        used = 0
+        for unit in sorted(members, key=lambda u: u.score, reverse=True):
+            if used + unit.cost <= share and spent + unit.cost <= budget:
+                chosen.add(unit)
+                used += unit.cost
+                spent += unit.cost
+    for unit in sorted(units, key=lambda u: u.score, reverse=True):
+        if unit not in chosen and spent + unit.cost <= budget:
+            chosen.add(unit)
+            spent += unit.cost
+    return [u for u in units if u in chosen]
+
+
+def render(lines, units):
+    """The kept units back in their lines, in original order. Headings stay
+    when anything under them does, a table rule when its table does."""
+    kept = {}
+    for unit in units:
+        kept.setdefault(unit.line, []).append(unit.text)
+
+    out, headings = [], []
+    for n, line in enumerate(lines):
+        if HEADING_RE.match(line):
+            # a heading closes the ones at its level or below that had nothing kept under them
+            level = len(line.lstrip()) - len(line.lstrip().lstrip("#"))
+            headings = [h for h in headings if len(h.lstrip()) - len(h.lstrip().lstrip("#")) < level] + [line]
+        elif TABLE_RULE_RE.match(line):
+            if n - 1 in kept and n + 1 in kept:
+                out.append(line)
+        elif n in kept:
+            out.extend(headings)
+            headings = []
+            if line.lstrip().startswith("|"):
+                out.append(line)
+            else:
+                prefix = PREFIX_RE.match(line)
+                out.append((prefix.group(0) if prefix else "") + " ".join(kept[n]))
+    return "\n".join(out)
+
+
+def compress_sections(sections, budget=SYNTHESIS_TOKEN_BUDGET):
+    """(compressed text of each section, stats) for a dict of section -> markdown.
+
+    Sentences repeated across sections are removed first, the most salient ones
+    then kept within budget tokens; nothing else is rewritten.
+    """
+    parsed = {name: split_units(name, text or "") for name, text in sections.items()}
+    units = [u for _, section_units in parsed.values() for u in section_units]
+    score_units(units)
+    unique = set(dedupe(units))
+    kept = select([u for u in units if u in unique], budget)
+
+    compressed = {}
+    for name, (lines, _) in parsed.items():
+        compressed[name] = render(lines, [u for u in kept if u.section == name])
+    stats = {
+        "tokens_in": sum(estimate_tokens(text or "") for text in sections.values()),
+        "tokens_out": sum(estimate_tokens(text) for text in compressed.values()),
+        "sentences": len(units),
+        "duplicates": len(units) - len(unique),
+        "dropped": len(unique) - len(kept),
+    }
+    return compressed, stats
@@ -1,17 +1,40 @@
 import os
+import json
+import argparse
 import time
+import random
+import threading
 import requests
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tenk
+import filingstore
+from filingstore import write_atomic
 
 # ---------------- Config ----------------
 BASE_DIR = Path("databank")
-BASE_DIR.mkdir(exist_ok=True)
+MANIFEST_FILE = BASE_DIR / "manifest.json"
+SUBMISSIONS_DIR = BASE_DIR / "submissions"
+
+# overridable to run against a mirror or the local stand-in in bench/
+SEC_DATA_URL = os.getenv("MARS_SEC_DATA_URL", "https://data.sec.gov")
+SEC_ARCHIVES_URL = os.getenv("MARS_SEC_ARCHIVES_URL", "https://www.sec.gov/Archives/edgar/data")
 
 HEADERS = {
     "User-Agent": "YourName your@email.com"
 }
 
+# defaults, both can be overridden on the command line
 YEARS = {"2023", "2024", "2025"}
+FORMS = {"10-K", "10-K/A"}
+
+# SEC fair access policy allows 10 requests/second per client, stay a little under
+MAX_REQUESTS_PER_SECOND = 8
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 60
 
 CIKS = {
     # --- Big Tech / AI ---
@@ -79,63 +102,257 @@ CIKS = {
 }
 
 
-def get_10k_filings(cik):
-    url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-    r = requests.get(url, headers=HEADERS)
-    r.raise_for_status()
-    data = r.json()
+class TokenBucket:
+    """Thread-safe token bucket, acquire() blocks until a request may be sent.
 
-    filings = data["filings"]["recent"]
-    results = []
+    capacity is the burst allowed after an idle spell. It defaults to a single
+    request, so no one-second window ever sees more than rate + 1 requests.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+limiter = TokenBucket(MAX_REQUESTS_PER_SECOND)
+
+# one keep-alive connection pool shared by all workers
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def get(url, **kwargs):
+    """Rate limited GET with exponential backoff on throttling, server errors and dropped connections."""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            r = session.get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            delay = None
+        else:
+            if r.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                r.raise_for_status()
+                return r
+            retry_after = r.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else None
+            r.close()
+
+        time.sleep(delay or min(2 ** attempt, 30) + random.random())
+
+
+class Manifest:
+    """Record of finished and failed downloads so an interrupted run resumes where it stopped."""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.data = {"files": {}, "failed": {}}
+        if self.path.exists():
+            self.data.update(json.loads(self.path.read_text(encoding="utf-8")))
+
+    def is_done(self, filing):
+        # the filing store is the source of truth for what is on disk
+        return filingstore.has(filing["accession"])
+
+    def mark_done(self, filing):
+        with self.lock:
+            self.data["files"][filing["accession"]] = {
+                "company": filing["company"],
+                "form": filing["form"],
+                "year": filing["year"],
+                "url": filing["url"],
+                "downloaded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.data["failed"].pop(filing["accession"], None)
+            self._save()
+
+    def mark_failed(self, filing, error):
+        with self.lock:
+            self.data["failed"][filing["accession"]] = {"url": filing["url"], "error": str(error)}
+            self._save()
+
+    def _save(self):
+        write_atomic(self.path, json.dumps(self.data, indent=1).encode("utf-8"))
+
+
+def get_cached_json(url, cache_file):
+    """GET a JSON document, revalidated against a local copy with ETag / If-Modified-Since."""
+    meta_file = cache_file.with_name(cache_file.stem + ".meta.json")
+    headers = {}
+    if cache_file.exists() and meta_file.exists():
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
 
-    for form, acc, date, primary in zip(
-        filings["form"],
-        filings["accessionNumber"],
-        filings["filingDate"],
-        filings["primaryDocument"]
-    ):
-        if form == "10-K" and date[:4] in YEARS:
+    r = get(url, headers=headers)
+    if r.status_code == 304:
+        return json.loads(cache_file.read_text(encoding="utf-8"))
+
+    write_atomic(cache_file, r.content)
+    write_atomic(meta_file, json.dumps({
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }).encode("utf-8"))
+    return r.json()
+
+
+def _rows(block):
+    return zip(block["form"], block["accessionNumber"], block["filingDate"], block["primaryDocument"])
+
+
+def get_filings(cik, forms=FORMS, years=YEARS):
+    """(form, year, accession, url) for every matching filing of a company."""
+    data = get_cached_json(f"{SEC_DATA_URL}/submissions/CIK{cik}.json", SUBMISSIONS_DIR / f"CIK{cik}.json")
+    rows = list(_rows(data["filings"]["recent"]))
+
+    # "recent" holds the latest ~1000 filings, busy filers need the older pages for earlier years
+    for page in data["filings"].get("files", []):
+        if page["filingTo"][:4] >= min(years) and page["filingFrom"][:4] <= max(years):
+            rows.extend(_rows(get_cached_json(f"{SEC_DATA_URL}/submissions/{page['name']}", SUBMISSIONS_DIR / page["name"])))
+
+    results = []
+    for form, acc, date, primary in rows:
+        if form in forms and date[:4] in years:
             acc_nodash = acc.replace("-", "")
-            doc_url = (
-                f"https://www.sec.gov/Archives/edgar/data/"
-                f"{int(cik)}/{acc_nodash}/{primary}"
-            )
-            results.append((date[:4], doc_url))
+            doc_url = f"{SEC_ARCHIVES_URL}/{int(cik)}/{acc_nodash}/{primary}"
+            results.append((form, date[:4], acc, doc_url))
 
     return results
 
 
-def download_file(url, out_path):
-    r = requests.get(url, headers=HEADERS)
-    r.raise_for_status()
-    out_path.write_bytes(r.content)
+def legacy_path(company, form, year, accession):
+    """Where runs before the filing store saved the raw HTML."""
+    if form == "10-K":
+        return BASE_DIR / company / f"{company}_10K_{year}.html"
+    return BASE_DIR / company / f"{company}_10KA_{year}_{accession}.html"
+
+
+def store_filing(filing, content):
+    sha = filingstore.put(filing["company"], filing["form"], filing["year"], filing["accession"], filing["url"], content)
+    # split into Items while the text is still in the page cache
+    tenk.index_filing(sha)
+
 
+def download_file(filing):
+    store_filing(filing, get(filing["url"]).content)
 
-for company, cik in CIKS.items():
-    company_dir = BASE_DIR / company
-    company_dir.mkdir(exist_ok=True)
 
-    print(f"\n📄 {company}")
+def adopt_legacy_file(filing):
+    """Move a raw file from an earlier run into the store, it is kept there compressed."""
+    path = filing["legacy_file"]
+    store_filing(filing, path.read_bytes())
+    path.unlink()
+    if not any(path.parent.iterdir()):
+        path.parent.rmdir()
 
-    try:
-        filings = get_10k_filings(cik)
-        if not filings:
-            print("  No 10-K filings found for selected years.")
-            continue
 
-        for year, url in filings:
-            filename = f"{company}_10K_{year}.html"
-            out_file = company_dir / filename
+def list_downloads(company, cik, forms, years):
+    """Filing dicts for each wanted filing of one company."""
+    return [
+        {
+            "company": company,
+            "form": form,
+            "year": year,
+            "accession": accession,
+            "url": url,
+            "name": f"{company} {form} {year} ({accession})",
+            "legacy_file": legacy_path(company, form, year, accession),
+        }
+        for form, year, accession, url in get_filings(cik, forms, years)
+    ]
 
-            if out_file.exists():
-                print(f"  ✔ Already exists: {filename}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download 10-K filings from SEC EDGAR into ./databank")
+    parser.add_argument("--years", nargs="+", default=sorted(YEARS), help="filing years to keep")
+    parser.add_argument("--forms", nargs="+", default=sorted(FORMS), help="form types to keep, e.g. 10-K 10-K/A")
+    parser.add_argument("--companies", nargs="+", choices=sorted(CIKS), metavar="COMPANY", help="subset of CIKS")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    forms, years = set(args.forms), set(args.years)
+    companies = {c: CIKS[c] for c in args.companies} if args.companies else CIKS
+
+    BASE_DIR.mkdir(exist_ok=True)
+    SUBMISSIONS_DIR.mkdir(exist_ok=True)
+    manifest = Manifest()
+    started = time.time()
+
+    with ThreadPoolExecutor(MAX_WORKERS) as pool:
+        # 1. submissions metadata for every company, revalidated against the local cache
+        downloads = []
+        listings = {pool.submit(list_downloads, company, cik, forms, years): company for company, cik in companies.items()}
+        for future in as_completed(listings):
+            company = listings[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                print(f"📄 {company}: Error: {e}")
                 continue
+            if not found:
+                print(f"📄 {company}: No {'/'.join(sorted(forms))} filings found for selected years.")
+            downloads.extend(found)
+
+        # 2. only filings no earlier run has fetched
+        pending = []
+        for filing in downloads:
+            if manifest.is_done(filing):
+                continue
+            if filing["legacy_file"].exists():
+                adopt_legacy_file(filing)
+                manifest.mark_done(filing)
+                print(f"  ✔ Moved into store: {filing['legacy_file'].name}")
+                continue
+            pending.append(filing)
+
+        futures = {pool.submit(download_file, f): f for f in pending}
+        failed = 0
+        for future in as_completed(futures):
+            filing = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                manifest.mark_failed(filing, e)
+                print(f"  ✖ {filing['name']}: {e}")
+                continue
+            manifest.mark_done(filing)
+            print(f"  ⬇ Downloaded {filing['name']}")
+
+    # filings stored before item extraction existed
+    tenk.index_all()
 
-            print(f"  ⬇ Downloading {filename}")
-            download_file(url, out_file)
-            time.sleep(0.2)  # SEC rate limit safety
+    usage = filingstore.usage()
+    print(f"\nDone in {time.time() - started:.0f}s: {len(downloads) - len(pending)} up to date, {len(pending) - failed} downloaded, {failed} failed.")
+    print(f"Filing store: {usage['filings']} filings, {usage['raw_bytes'] / 1e6:.0f} MB raw stored in {usage['stored_bytes'] / 1e6:.0f} MB (+{usage['text_bytes'] / 1e6:.0f} MB text) under ./databank/")
+    if failed:
+        print("Run again to retry the failed downloads.")
 
-    except Exception as e:
-        print(f"Error: {e}")
 
-print("\nDone. Files saved in ./databank/")
+if __name__ == "__main__":
+    main()
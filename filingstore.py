@@ -0,0 +1,196 @@
+import os, re, gzip, mmap, time, hashlib, tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+from catalog import open_db
+from textutils import html_to_text
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+# databank/objects/<ab>/<sha256>.html.zst  raw filing, compressed, stored once per distinct content
+# databank/text/<ab>/<sha256>.txt          extracted plain text, uncompressed so it can be memory-mapped
+STORE_DIR = Path("databank")
+OBJECTS_DIR = STORE_DIR / "objects"
+TEXT_DIR = STORE_DIR / "text"
+STORE_DB = STORE_DIR / "store.db"
+
+CODEC = "zst" if zstandard else "gz"
+ZSTD_LEVEL = 19
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    accession   TEXT PRIMARY KEY,
+    company     TEXT NOT NULL,
+    form        TEXT NOT NULL,
+    year        TEXT NOT NULL,
+    url         TEXT,
+    sha256      TEXT NOT NULL,
+    codec       TEXT NOT NULL,
+    raw_size    INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    text_size   INTEGER NOT NULL,
+    added_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS filings_company ON filings (company, year);
+CREATE INDEX IF NOT EXISTS filings_sha ON filings (sha256);
+CREATE TABLE IF NOT EXISTS sections (
+    sha256 TEXT NOT NULL,
+    item   TEXT NOT NULL,
+    title  TEXT NOT NULL,
+    start  INTEGER NOT NULL,
+    end    INTEGER NOT NULL,
+    PRIMARY KEY (sha256, item)
+);
+"""
+
+
+@contextmanager
+def db():
+    conn = open_db(STORE_DB, SCHEMA)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def write_atomic(path, content):
+    """Write through a temp file in the same directory so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def object_path(sha, codec=CODEC):
+    return OBJECTS_DIR / sha[:2] / f"{sha}.html.{codec}"
+
+
+def text_path(sha):
+    return TEXT_DIR / sha[:2] / f"{sha}.txt"
+
+
+def _compress(content):
+    if CODEC == "zst":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(content)
+    return gzip.compress(content, compresslevel=9)
+
+
+def _decompress(data, codec):
+    if codec == "zst":
+        if not zstandard:
+            raise RuntimeError("this filing is zstd compressed, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def put(company, form, year, accession, url, content):
+    """Store a downloaded filing. Identical content is only written once. Returns its sha256."""
+    sha = hashlib.sha256(content).hexdigest()
+
+    with db() as conn:
+        existing = conn.execute("SELECT codec FROM filings WHERE sha256 = ? LIMIT 1", (sha,)).fetchone()
+    codec = existing["codec"] if existing else CODEC
+
+    blob = object_path(sha, codec)
+    if not blob.exists():
+        write_atomic(blob, _compress(content))
+
+    text = text_path(sha)
+    if not text.exists():
+        write_atomic(text, html_to_text(content.decode("utf-8", errors="ignore")).encode("utf-8"))
+
+    with db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                accession, company, form, year, url, sha, codec,
+                len(content), blob.stat().st_size, text.stat().st_size, time.time(),
+            ),
+        )
+    return sha
+
+
+def has(accession):
+    with db() as conn:
+        return conn.execute("SELECT 1 FROM filings WHERE accession = ?", (accession,)).fetchone() is not None
+
+
+def get(accession):
+    with db() as conn:
+        row = conn.execute("SELECT * FROM filings WHERE accession = ?", (accession,)).fetchone()
+    return dict(row) if row else None
+
+
+def find(company=None, year=None, form=None):
+    """Filing rows matching the filters, newest year first."""
+    clauses, params = [], []
+    for column, value in (("company", company), ("year", year), ("form", form)):
+        if value:
+            clauses.append(f"{column} = ? COLLATE NOCASE")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with db() as conn:
+        rows = conn.execute(f"SELECT * FROM filings {where} ORDER BY company, year DESC, form", params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def match_company(name):
+    """Stored company name for a free-text one, e.g. "Berkshire Hathaway" -> "BerkshireHathaway"."""
+    key = re.sub(r"[^a-z0-9]", "", (name or "").lower())
+    if not key:
+        return None
+    with db() as conn:
+        companies = [row[0] for row in conn.execute("SELECT DISTINCT company FROM filings")]
+    for company in companies:
+        if re.sub(r"[^a-z0-9]", "", company.lower()) == key:
+            return company
+    return None
+
+
+def read_html(accession):
+    """The original filing bytes."""
+    row = get(accession)
+    if not row:
+        raise KeyError(accession)
+    return _decompress(object_path(row["sha256"], row["codec"]).read_bytes(), row["codec"])
+
+
+@contextmanager
+def open_text(sha):
+    """Memory-mapped UTF-8 text of a filing as a memoryview, slices are zero-copy."""
+    path = text_path(sha)
+    if path.stat().st_size == 0:
+        yield memoryview(b"")
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+
+
+def read_text(sha, start=0, end=None):
+    """Decoded slice of a filing's text, reading only the mapped pages it touches."""
+    with open_text(sha) as view:
+        return bytes(view[start:end]).decode("utf-8", errors="ignore")
+
+
+def usage():
+    """Raw vs stored bytes across the store."""
+    with db() as conn:
+        raw, stored, text, n = conn.execute(
+            "SELECT COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0), COALESCE(SUM(text_size), 0), COUNT(*) "
+            "FROM (SELECT raw_size, stored_size, text_size FROM filings GROUP BY sha256)"
+        ).fetchone()
+    return {"filings": n, "raw_bytes": raw, "stored_bytes": stored, "text_bytes": text}
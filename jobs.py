@@ -0,0 +1,270 @@
+import os, time, uuid, asyncio, traceback
+from functools import partial
+
+import ratelimit
+from state import state
+from agents import RESEARCH_AGENTS
+from tools import research_params, trigger_deep_research, refresh_research
+
+# how many deep research runs may execute at once, the rest wait in the queue
+MAX_WORKERS = int(os.getenv("MARS_RESEARCH_WORKERS", "2"))
+
+# finished jobs kept around for /jobs/{id} lookups
+MAX_FINISHED_JOBS = 200
+
+# a job's lock outlives a worker that died while running it by at most this (seconds)
+JOB_LOCK_TTL = 2 * 3600
+
+# progress events kept per job for /jobs/{id}/events, the oldest are dropped first
+MAX_JOB_EVENTS = 500
+
+# how often a job running in another worker is looked up again while following it (seconds)
+FOLLOW_POLL_INTERVAL = 2
+
+# job kind -> coroutine running it
+RUNNERS = {
+    "research": trigger_deep_research,
+    "refresh": refresh_research,
+}
+
+
+def job_key(args, kind="research"):
+    """Jobs with the same key are the same piece of work and get coalesced."""
+    params = research_params(args)
+    key = (
+        kind,
+        params["company_name"].lower(),
+        params["geo_focus"].lower(),
+        (params["industry_focus"] or "").lower(),
+        params["time_horizon"].lower(),
+    )
+    if kind == "refresh":
+        key += (tuple(s for s in RESEARCH_AGENTS if s in (args.get("sections") or ())),)
+    elif args.get("refresh"):
+        # asked to ignore cached sections, joining a run that may reuse them would drop that
+        key += ("refresh",)
+    return key
+
+
+def lock_name(key):
+    return "job:" + "|".join(str(part) for part in key)
+
+
+class RunningElsewhere(Exception):
+    """The job's lock is held by an owner that published no job record to follow."""
+
+    def __init__(self, args, holder):
+        self.holder = holder
+        super().__init__(f"Research for {args.get('company_name')} is already running as {holder}, "
+                         "its report appears in /reports when it finishes.")
+
+
+class Job:
+    def __init__(self, args, kind="research"):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = job_key(args, kind)
+        # as given, each runner applies its own defaults
+        self.args = dict(args)
+
+        # queued -> running -> done | failed
+        self.status = "queued"
+        self.result = None
+        self.error = None
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        # section -> running | ok | cached | timeout | error, and the report so far
+        self.progress = {}
+        self.partial_report = None
+
+        # (seq, event) for live streams, updated is set and replaced on every new event
+        self.events = []
+        self.seq = 0
+        self.updated = asyncio.Event()
+
+        self.task = None
+
+    def publish(self, event, **data):
+        """Add a progress event, waking everyone following the job."""
+        event = {"event": event, "at": time.time(), **data} if isinstance(event, str) else event
+        if event["event"] == "agent_started":
+            self.progress[event["section"]] = "running"
+        elif event["event"] == "agent_done":
+            self.progress[event["section"]] = event["outcome"]
+            self.partial_report = event.get("partial_report") or self.partial_report
+
+        self.seq += 1
+        self.events.append((self.seq, event))
+        del self.events[:-MAX_JOB_EVENTS]
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "args": self.args,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "partial_report": self.partial_report,
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        """A job run by another worker, as last published to the shared state."""
+        job = cls(record["args"], record["kind"])
+        job.id = record["job_id"]
+        for name in ("status", "result", "error", "created_at", "started_at", "finished_at"):
+            setattr(job, name, record[name])
+        job.progress = record.get("progress") or {}
+        job.partial_report = record.get("partial_report")
+        return job
+
+
+class JobManager:
+    """Runs deep research in the background on a bounded pool, one job per key in flight.
+
+    Job records and per-key locks go through the state backend, so with a shared
+    backend a job started by one worker is found and joined from every other.
+    """
+
+    def __init__(self, runners=RUNNERS, max_workers=MAX_WORKERS, state=state):
+        self.runners = runners
+        self.max_workers = max_workers
+        self.state = state
+        self.jobs = {}
+        self.inflight = {}
+        self._slots = None
+        # one submission at a time, so two identical ones of this worker cannot both miss inflight
+        self._submitting = asyncio.Lock()
+
+    async def submit(self, args, kind="research"):
+        """Return (job, created). An identical in-flight job is reused instead of starting a new one,
+        RunningElsewhere is raised when its owner has no job record."""
+        async with self._submitting:
+            return await self._submit(args, kind)
+
+    async def _submit(self, args, kind):
+        key = job_key(args, kind)
+        job = self.inflight.get(key)
+        if job:
+            return job, False
+
+        job = Job(args, kind)
+        # the lock can wait on another worker's write transaction, so state I/O stays off the loop
+        holder = await asyncio.to_thread(self.state.acquire, lock_name(key), job.id, JOB_LOCK_TTL)
+        if holder:
+            # running in another worker
+            record = await asyncio.to_thread(self.state.get_job, holder)
+            if not record:
+                raise RunningElsewhere(args, holder)
+            return Job.from_dict(record), False
+
+        if self._slots is None:
+            # created lazily so it binds to the server's event loop
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        self.jobs[job.id] = job
+        self.inflight[key] = job
+        job.publish("job_queued", status=job.status)
+        await asyncio.to_thread(self.state.put_job, job.to_dict())
+        job.task = asyncio.create_task(self._run(job))
+        self._prune()
+        return job, True
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            return job
+        record = await asyncio.to_thread(self.state.get_job, job_id)
+        return Job.from_dict(record) if record else None
+
+    async def list(self):
+        return await asyncio.to_thread(self.state.list_jobs)
+
+    async def follow(self, job_id, after=0, keepalive=15):
+        """Yield (seq, event) for a job's events after seq until it finishes, (None, None) after
+        keepalive seconds without any. Jobs of other workers are followed by polling their record."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            async for item in self._follow_record(job_id, keepalive):
+                yield item
+            return
+
+        while True:
+            # taken before reading, an event published while we yield still wakes us
+            updated = job.updated
+            for seq, event in [(s, e) for s, e in job.events if s > after]:
+                after = seq
+                yield seq, event
+            if job.finished_at:
+                return
+            try:
+                await asyncio.wait_for(updated.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None, None
+
+    async def _follow_record(self, job_id, keepalive):
+        """Coarse progress of a job running elsewhere: a status event whenever its record changes."""
+        seq, last, idle = 0, None, 0
+        while True:
+            record = await asyncio.to_thread(self.state.get_job, job_id)
+            if record is None:
+                return
+            snapshot = {name: record.get(name) for name in ("status", "progress", "partial_report", "result", "error")}
+            if snapshot != last:
+                seq, last, idle = seq + 1, snapshot, 0
+                yield seq, {"event": "status", "at": time.time(), **snapshot}
+            elif idle >= keepalive:
+                idle = 0
+                yield None, None
+            if record["finished_at"]:
+                return
+            await asyncio.sleep(FOLLOW_POLL_INTERVAL)
+            idle += FOLLOW_POLL_INTERVAL
+
+    async def _progress(self, job, event):
+        job.publish(event)
+        if event["event"] == "agent_done":
+            # section level progress for workers following this job through the shared state
+            await asyncio.to_thread(self.state.put_job, job.to_dict())
+
+    async def _run(self, job):
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.started_at = time.time()
+                job.publish("job_started", status=job.status)
+                await asyncio.to_thread(self.state.put_job, job.to_dict())
+                # a job started from a chat turn does not inherit its priority
+                with ratelimit.priority("research"):
+                    job.result = await self.runners[job.kind](job.args, progress=partial(self._progress, job))
+                job.status = "done"
+                # replaced by the finished report, a failed run keeps it
+                job.partial_report = None
+        except Exception as e:
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self.inflight.pop(job.key, None)
+            job.publish("job_" + job.status, status=job.status, result=job.result, error=job.error)
+            await asyncio.to_thread(self.state.put_job, job.to_dict())
+            await asyncio.to_thread(self.state.release, lock_name(job.key), job.id)
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished_at]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+
+research_jobs = JobManager()
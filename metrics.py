@@ -0,0 +1,117 @@
+import os, json, time, threading
+from contextlib import contextmanager
+
+from catalog import DATA_DIR
+
+# per-run JSON traces: one file per research run, one line per chat turn in chat.jsonl
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+
+# histogram buckets in seconds, from a tool call to a full research run
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400)
+
+HELP = {
+    "mars_chat_turn_seconds": ("histogram", "Wall time of a /chat turn, all iterations and tools included"),
+    "mars_chat_iteration_seconds": ("histogram", "Wall time of one model round trip plus its tool calls"),
+    "mars_tool_seconds": ("histogram", "Tool call latency"),
+    "mars_tool_errors_total": ("counter", "Tool calls that raised"),
+    "mars_openai_seconds": ("histogram", "OpenAI API call latency"),
+    "mars_openai_tokens_total": ("counter", "Tokens reported by the OpenAI API"),
+    "mars_agent_seconds": ("histogram", "Research agent wall time"),
+    "mars_agent_cost_usd_total": ("counter", "GPT Researcher cost of research agents in USD"),
+    "mars_research_seconds": ("histogram", "Wall time of a research or refresh run"),
+    "mars_routed_total": ("counter", "Chat turns answered by the fast-path router, by intent"),
+    "mars_ratelimit_wait_seconds": ("histogram", "Time a call waited for provider quota, by provider and priority"),
+    "mars_ratelimit_429_total": ("counter", "429 responses from a provider"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    with _lock:
+        key = _key(name, labels)
+        # bucket counts are cumulative, as exposed
+        counts, total, count = _histograms.get(key, ([0] * len(BUCKETS), 0.0, 0))
+        for n, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                counts[n] += 1
+        _histograms[key] = (counts, total + seconds, count + 1)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the wall time of the block, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def record_usage(model, usage, kind="chat"):
+    """Count the tokens of an OpenAI response's usage object, if it has one."""
+    if usage is None:
+        return
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, token_type, None)
+        if tokens:
+            inc("mars_openai_tokens_total", tokens, model=model, kind=kind, type=token_type.split("_")[0])
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(counts), total, count) for key, (counts, total, count) in _histograms.items()}
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, in_bucket in zip(BUCKETS, counts):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {in_bucket}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def save_trace(kind, run_id, trace):
+    """Write the JSON trace of a research run to data/traces/<kind>-<run id>.json."""
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"{kind}-{run_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(trace, f, indent=1)
+    return path
+
+
+def append_trace(name, trace):
+    """Append a small trace, e.g. of a chat turn, as one line of data/traces/<name>.jsonl."""
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    with _lock, open(os.path.join(TRACE_DIR, f"{name}.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(trace) + "\n")
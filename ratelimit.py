@@ -0,0 +1,221 @@
+import os, time, heapq, asyncio, itertools, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import metrics
+
+# lower goes first: a chat turn never waits behind research, research never behind a batch
+PRIORITIES = {"interactive": 0, "research": 1, "batch": 2}
+
+# priority of calls that do not name one, set around a batch with priority("batch")
+current_priority = ContextVar("priority", default="research")
+
+# requests and tokens per minute of each provider, set them to the account's limits.
+# What OpenAI reports as remaining in its x-ratelimit-* headers is followed as well.
+# Tavily is only called by GPT Researcher's retriever, whose HTTP client is out of reach:
+# its limit is enforced through the RESEARCH_PHASE_COST estimates alone, and its 429s
+# are not seen here, so it gets no backoff
+LIMITS = {
+    "openai": (int(os.getenv("MARS_OPENAI_RPM", "500")), int(os.getenv("MARS_OPENAI_TPM", "200000"))),
+    # embeddings have their own quota, so indexing filings never starves chat
+    "openai_embeddings": (int(os.getenv("MARS_EMBEDDING_RPM", "3000")), int(os.getenv("MARS_EMBEDDING_TPM", "1000000"))),
+    "tavily": (int(os.getenv("MARS_TAVILY_RPM", "100")), None),
+}
+
+# share of each bucket only interactive calls may use, so chat has quota while research saturates the rest
+INTERACTIVE_RESERVE = float(os.getenv("MARS_INTERACTIVE_RESERVE", "0.2"))
+
+# after a 429 background calls pause and the rate is halved, recovering to full over RECOVERY_SECONDS
+MIN_BACKOFF = 1
+MAX_BACKOFF = 60
+RECOVERY_SECONDS = 120
+
+# GPT Researcher makes its own API calls, which cannot be metered one by one,
+# so each phase reserves what it typically uses: provider -> (requests, tokens)
+RESEARCH_PHASE_COST = {
+    "conduct_research": {"openai": (6, 24_000), "tavily": (5, 0)},
+    "write_report": {"openai": (2, 16_000)},
+}
+
+# longest sleep between checks while waiting, a higher priority arrival is noticed this fast
+POLL_SECONDS = 0.25
+
+
+class Bucket:
+    """Token bucket refilled continuously, holding at most one minute of quota."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now, scale):
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute * scale / 60)
+        self.updated = now
+
+    def wait(self, amount, floor, scale):
+        """Seconds until amount can be taken while leaving floor in the bucket."""
+        # a request larger than the whole bucket goes through once it is full
+        amount = min(amount, self.per_minute - floor)
+        deficit = amount + floor - self.level
+        return max(0.0, deficit) * 60 / (self.per_minute * scale)
+
+
+class Limiter:
+    """Requests and tokens per minute of one provider, shared by every caller in the process.
+
+    Waiting callers are served by priority, then arrival. Only interactive calls
+    may use the last INTERACTIVE_RESERVE of a bucket or go ahead while a 429 pauses
+    the provider.
+    """
+
+    def __init__(self, name, rpm, tpm=None):
+        self.name = name
+        self.requests = Bucket(rpm)
+        self.tokens = Bucket(tpm) if tpm else None
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.backoff = MIN_BACKOFF
+        self._recovered = time.monotonic()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _try(self, ticket, tokens):
+        """Take the quota for ticket and return 0, or the seconds to wait before trying again."""
+        priority = ticket[0]
+        with self._lock:
+            now = time.monotonic()
+            self.scale = min(1.0, self.scale + (now - self._recovered) / RECOVERY_SECONDS)
+            self._recovered = now
+            self.requests.refill(now, self.scale)
+            if self.tokens:
+                self.tokens.refill(now, self.scale)
+
+            if self._waiting[0] != ticket:
+                return POLL_SECONDS / 5
+            if priority > PRIORITIES["interactive"] and now < self.paused_until:
+                return self.paused_until - now
+
+            reserve = 0 if priority == PRIORITIES["interactive"] else INTERACTIVE_RESERVE
+            wait = self.requests.wait(1, reserve * self.requests.per_minute, self.scale)
+            if self.tokens:
+                wait = max(wait, self.tokens.wait(tokens, reserve * self.tokens.per_minute, self.scale))
+            if wait:
+                return wait
+
+            self.requests.level -= 1
+            if self.tokens:
+                self.tokens.level -= min(tokens, self.tokens.per_minute)
+            return 0
+
+    def _enter(self, priority):
+        ticket = (PRIORITIES[priority or current_priority.get()], next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _leave(self, ticket, started, priority):
+        with self._lock:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+        metrics.observe("mars_ratelimit_wait_seconds", time.monotonic() - started, provider=self.name,
+                        priority=priority or current_priority.get())
+
+    async def acquire(self, tokens=0, priority=None):
+        """Wait for one request and tokens of quota."""
+        started = time.monotonic()
+        ticket = self._enter(priority)
+        try:
+            while wait := self._try(ticket, tokens):
+                await asyncio.sleep(min(wait, POLL_SECONDS))
+        finally:
+            self._leave(ticket, started, priority)
+
+    def acquire_sync(self, tokens=0, priority=None):
+        """acquire for code running in a thread"""
+        started = time.monotonic()
+        ticket = self._enter(priority)
+        try:
+            while wait := self._try(ticket, tokens):
+                time.sleep(min(wait, POLL_SECONDS))
+        finally:
+            self._leave(ticket, started, priority)
+
+    def settle(self, reserved, used):
+        """Correct the token bucket by what a call actually used: its reported usage,
+        0 for a call that failed before the provider answered, None keeps the estimate."""
+        if self.tokens and used is not None:
+            with self._lock:
+                self.tokens.level -= used - reserved
+
+    def throttled(self, retry_after=None):
+        """A 429 from the provider: pause background calls and halve the rate."""
+        with self._lock:
+            now = time.monotonic()
+            delay = min(max(retry_after or self.backoff, MIN_BACKOFF), MAX_BACKOFF)
+            self.paused_until = max(self.paused_until, now + delay)
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+            self.scale = max(0.1, self.scale / 2)
+            self._recovered = now
+        metrics.inc("mars_ratelimit_429_total", provider=self.name)
+
+    def observe_headers(self, headers):
+        """Follow the provider's own accounting from x-ratelimit-remaining-* response headers."""
+        with self._lock:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}", "")
+                if bucket and remaining.isdigit():
+                    bucket.level = min(bucket.level, float(remaining))
+            if time.monotonic() >= self.paused_until:
+                self.backoff = MIN_BACKOFF
+
+
+limiters = {name: Limiter(name, rpm, tpm) for name, (rpm, tpm) in LIMITS.items()}
+
+
+@contextmanager
+def priority(name):
+    """Run the calls made inside, including tasks started there, at this priority."""
+    token = current_priority.set(name)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+async def reserve_phase(phase):
+    """Wait for the quota a GPT Researcher phase typically uses, on every provider it calls."""
+    for provider, (requests, tokens) in RESEARCH_PHASE_COST[phase].items():
+        limiter = limiters[provider]
+        for _ in range(requests):
+            await limiter.acquire(tokens // requests)
+
+
+def retry_after(response):
+    value = response.headers.get("retry-after", "")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def response_hook(provider):
+    """httpx response hook feeding a provider's limiter with its 429s and rate limit headers.
+    These include the retries the OpenAI client makes on its own."""
+    limiter = limiters[provider]
+
+    def observe(response):
+        if response.status_code == 429:
+            limiter.throttled(retry_after(response))
+        else:
+            limiter.observe_headers(response.headers)
+    return observe
+
+
+def async_response_hook(provider):
+    observe = response_hook(provider)
+
+    async def observe_async(response):
+        observe(response)
+    return observe_async
@@ -1,6 +1,24 @@
+import os, re, gzip, threading
 import markdown
+from collections import OrderedDict
+from html.parser import HTMLParser
+import catalog
 from agents import CompanyResearcher
 
+try:
+    import brotli
+except ImportError:  # optional, reports are still served gzipped
+    brotli = None
+
+# precompressed variants written next to each report, by Content-Encoding
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# a report being researched, rewritten as sections finish and removed once the report is saved
+PARTIAL_SUFFIX = ".partial.html"
+
+# stands in for the sections of a partial report that are not done yet
+PENDING_SECTION = "> ⏳ This section is still being researched."
+
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -147,15 +165,134 @@ def md_section(title, md_text):
     """
 
 
-def save_html(research: CompanyResearcher, filename="report.html"):
+class SectionParser(HTMLParser):
+    """Plain text of each <section> written by md_section, keyed by its <h2> title."""
+
+    SKIP = {"style", "script"}
+    PARAGRAPH = {"p", "h1", "h3", "h4", "h5", "h6", "ul", "ol", "table", "pre", "blockquote"}
+    LINE = {"br", "tr", "div"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = OrderedDict()
+        self._skip = 0
+        self._title = None
+        self._parts = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "section":
+            self._title, self._parts = [], []
+        elif self._parts is None:
+            return
+        elif tag == "h2" and not self._title:
+            self._in_title = True
+        elif tag == "li":
+            self._parts.append("\n- ")
+        elif tag in ("td", "th"):
+            self._parts.append(" | ")
+        elif tag in self.PARAGRAPH:
+            self._parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip -= 1
+        elif self._parts is None:
+            return
+        elif tag == "section":
+            title = "".join(self._title).strip()
+            text = re.sub(r"[ \t]+", " ", "".join(self._parts))
+            text = re.sub(r" *\n *", "\n", text)
+            self.sections[title] = re.sub(r"\n{3,}", "\n\n", text).strip()
+            self._title = self._parts = None
+        elif tag == "h2" and self._in_title:
+            self._in_title = False
+        elif tag in self.PARAGRAPH:
+            self._parts.append("\n\n")
+        elif tag in self.LINE:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skip or self._parts is None:
+            return
+        if not data.strip():
+            # markup indentation between tags, not content
+            data = " "
+        (self._title if self._in_title else self._parts).append(data)
+
+
+# parsed reports keyed by path, invalidated when the file's mtime changes
+PARSE_CACHE_SIZE = 64
+_parsed = OrderedDict()
+_parsed_lock = threading.Lock()
+
+
+def parse_report(path):
+    """Return an ordered {section title: plain text} dict for a saved report."""
+    mtime = os.stat(path).st_mtime_ns
+    with _parsed_lock:
+        cached = _parsed.get(path)
+        if cached and cached[0] == mtime:
+            _parsed.move_to_end(path)
+            return cached[1]
+
+    parser = SectionParser()
+    with open(path, "r", encoding="utf-8") as f:
+        parser.feed(f.read())
+    parser.close()
+
+    with _parsed_lock:
+        _parsed[path] = (mtime, parser.sections)
+        while len(_parsed) > PARSE_CACHE_SIZE:
+            _parsed.popitem(last=False)
+    return parser.sections
+
+
+def _encode(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=11, mode=brotli.MODE_TEXT)
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def write_variants(filename, content):
+    """Write the compressed copies of a report, served to browsers that accept them."""
+    for encoding, suffix in ENCODINGS.items():
+        if encoding == "br" and not brotli:
+            continue
+        tmp = f"{filename}{suffix}.part"
+        with open(tmp, "wb") as f:
+            f.write(_encode(content, encoding))
+        os.replace(tmp, filename + suffix)
+
+
+def precompress_all(report_dir):
+    """Create missing or outdated compressed copies, e.g. for reports written by hand."""
+    for entry in os.scandir(report_dir):
+        if not entry.name.endswith(".html") or entry.name.endswith(PARTIAL_SUFFIX):
+            continue
+        mtime = entry.stat().st_mtime
+        stale = [
+            suffix for encoding, suffix in ENCODINGS.items()
+            if (encoding != "br" or brotli)
+            and (not os.path.exists(entry.path + suffix) or os.path.getmtime(entry.path + suffix) < mtime)
+        ]
+        if stale:
+            with open(entry.path, "rb") as f:
+                write_variants(entry.path, f.read())
+
+
+def render_html(research: CompanyResearcher, pending=None):
+    """The report page, sections without content yet show pending instead."""
     sections = ""
-    sections += md_section("💰 Financials & Regulatory Research", research.financials)
-    sections += md_section("📰 News & Media Intelligence", research.news)
-    sections += md_section("🤔 Social & Public Sentiment", research.sentiment)
-    sections += md_section("🌐 Market & Competitive Context", research.market)
-    sections += md_section("✨ Insight Synthesis", research.synthesis)
+    sections += md_section("💰 Financials & Regulatory Research", research.financials or pending or "")
+    sections += md_section("📰 News & Media Intelligence", research.news or pending or "")
+    sections += md_section("🤔 Social & Public Sentiment", research.sentiment or pending or "")
+    sections += md_section("🌐 Market & Competitive Context", research.market or pending or "")
+    sections += md_section("✨ Insight Synthesis", research.synthesis or pending or "")
 
-    html = HTML_TEMPLATE.format(
+    return HTML_TEMPLATE.format(
         company=research.company_name,
         industry=research.industry_focus,
         geo=research.geo_focus,
@@ -163,7 +300,37 @@ def save_html(research: CompanyResearcher, filename="report.html"):
         sections=sections
     )
 
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+
+def partial_path(filename):
+    return filename.removesuffix(".html") + PARTIAL_SUFFIX
+
+
+def save_partial(research: CompanyResearcher, filename):
+    """Write the finished sections so far to the partial copy of filename, returns its path."""
+    path = partial_path(filename)
+    with open(path + ".part", "wb") as f:
+        f.write(render_html(research, PENDING_SECTION).encode("utf-8"))
+    # readers never see a half written page
+    os.replace(path + ".part", path)
+    return path
+
+
+def save_html(research: CompanyResearcher, filename="report.html"):
+    content = render_html(research).encode("utf-8")
+    with open(filename, "wb") as f:
+        f.write(content)
+    # written after the page, a copy older than its page is never served
+    write_variants(filename, content)
+    if os.path.exists(partial_path(filename)):
+        os.remove(partial_path(filename))
+
+    catalog.record_report(
+        filename,
+        company=research.company_name,
+        industry=research.industry_focus,
+        geo=research.geo_focus,
+        time_horizon=research.time_horizon,
+        etag=catalog.content_etag(content),
+    )
 
     print(f"📄 HTML report saved: {filename}")
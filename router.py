@@ -0,0 +1,151 @@
+import os, re
+from collections import namedtuple
+
+import catalog
+from tools import LLM_NOTE
+
+# MARS_ROUTER=off sends every message through the model
+ROUTER_ENABLED = os.getenv("MARS_ROUTER", "on").lower() not in ("off", "0", "false")
+
+# TradingView symbols of the companies in the databank
+TICKERS = {
+    "AAPL": "NASDAQ:AAPL", "MSFT": "NASDAQ:MSFT", "AMZN": "NASDAQ:AMZN", "GOOGL": "NASDAQ:GOOGL",
+    "GOOG": "NASDAQ:GOOG", "NVDA": "NASDAQ:NVDA", "META": "NASDAQ:META", "TSLA": "NASDAQ:TSLA",
+    "BRK.B": "NYSE:BRK.B", "JPM": "NYSE:JPM", "BAC": "NYSE:BAC", "WFC": "NYSE:WFC", "GS": "NYSE:GS",
+    "MS": "NYSE:MS", "XOM": "NYSE:XOM", "CVX": "NYSE:CVX", "INTC": "NASDAQ:INTC", "AMD": "NASDAQ:AMD",
+    "QCOM": "NASDAQ:QCOM", "AVGO": "NASDAQ:AVGO", "TXN": "NASDAQ:TXN", "WMT": "NASDAQ:WMT",
+    "COST": "NASDAQ:COST", "HD": "NYSE:HD", "KO": "NYSE:KO", "PEP": "NASDAQ:PEP", "MCD": "NYSE:MCD",
+    "NKE": "NYSE:NKE", "JNJ": "NYSE:JNJ", "PFE": "NYSE:PFE", "UNH": "NYSE:UNH", "MRK": "NYSE:MRK",
+    "VZ": "NYSE:VZ", "T": "NYSE:T", "CMCSA": "NASDAQ:CMCSA", "DIS": "NYSE:DIS", "BA": "NYSE:BA",
+    "CAT": "NYSE:CAT", "GE": "NYSE:GE", "V": "NYSE:V", "MA": "NYSE:MA", "ORCL": "NYSE:ORCL",
+    "CRM": "NYSE:CRM", "ADBE": "NASDAQ:ADBE",
+}
+
+COMPANY_TICKERS = {
+    "apple": "AAPL", "microsoft": "MSFT", "amazon": "AMZN", "alphabet": "GOOGL", "google": "GOOGL",
+    "nvidia": "NVDA", "meta": "META", "facebook": "META", "tesla": "TSLA",
+    "berkshire": "BRK.B", "berkshire hathaway": "BRK.B", "jpmorgan": "JPM", "jp morgan": "JPM",
+    "jpmorgan chase": "JPM", "bank of america": "BAC", "wells fargo": "WFC", "goldman": "GS",
+    "goldman sachs": "GS", "morgan stanley": "MS", "exxon": "XOM", "exxonmobil": "XOM", "exxon mobil": "XOM",
+    "chevron": "CVX", "intel": "INTC", "amd": "AMD", "qualcomm": "QCOM", "broadcom": "AVGO",
+    "texas instruments": "TXN", "walmart": "WMT", "costco": "COST", "home depot": "HD",
+    "coca cola": "KO", "coca-cola": "KO", "coke": "KO", "pepsi": "PEP", "pepsico": "PEP",
+    "mcdonalds": "MCD", "mcdonald's": "MCD", "nike": "NKE", "johnson & johnson": "JNJ",
+    "johnson and johnson": "JNJ", "j&j": "JNJ", "pfizer": "PFE", "unitedhealth": "UNH",
+    "united health": "UNH", "merck": "MRK", "verizon": "VZ", "at&t": "T", "att": "T",
+    "comcast": "CMCSA", "disney": "DIS", "boeing": "BA", "caterpillar": "CAT",
+    "general electric": "GE", "visa": "V", "mastercard": "MA", "oracle": "ORCL",
+    "salesforce": "CRM", "adobe": "ADBE",
+}
+
+TIMEFRAMES = {
+    "daily": "1D", "day": "1D", "1d": "1D", "intraday": "1D",
+    "monthly": "1M", "month": "1M", "1m": "1M",
+    "yearly": "1Y", "year": "1Y", "annual": "1Y", "1y": "1Y",
+}
+
+# words a command may carry besides its subject, anything else goes to the model
+FILLER = {
+    "please", "pls", "can", "could", "would", "will", "you", "i", "we", "me", "us", "want", "like", "to",
+    "a", "an", "the", "my", "our", "of", "for", "on", "about", "in", "with", "its", "their", "and", "now",
+    "show", "display", "open", "view", "see", "get", "give", "pull", "bring", "up", "let", "look", "at",
+}
+CHART_WORDS = {"chart", "charts", "graph", "price", "stock", "share", "shares", "ticker", "plot", "draw", "timeframe"}
+LIST_WORDS = {
+    "list", "reports", "researches", "all", "existing", "saved", "available", "previous", "past",
+    "which", "what", "do", "have", "are", "there", "any", "done", "so", "far",
+}
+OPEN_WORDS = {"report", "read", "fetch", "latest", "last", "newest", "recent", "most", "file", "html"}
+OPEN_VERBS = {"open", "show", "view", "display", "read", "fetch", "pull", "bring", "see"}
+
+WORD = re.compile(r"[\w&'.:-]+")
+SYMBOL = re.compile(r"^(?:[A-Z]{2,10}:)?[A-Z]{1,5}(?:\.[A-Z])?$")
+
+# tool to run and its arguments. reply turns the tool result into the answer,
+# None leaves the answer to one model call that sees the result
+Route = namedtuple("Route", "intent tool args reply")
+
+
+def _words(text):
+    return [w.strip(".,'-:") for w in WORD.findall(text) if w.strip(".,'-:")]
+
+
+def _take_phrases(text, phrases):
+    """(phrases found in the lowercased text, text without them), longest phrases first."""
+    found = []
+    lowered = text.lower()
+    for phrase in sorted(phrases, key=len, reverse=True):
+        pattern = rf"(?<![\w&]){re.escape(phrase)}(?![\w&])"
+        if re.search(pattern, lowered):
+            found.append(phrase)
+            lowered = re.sub(pattern, " ", lowered)
+    return found, lowered
+
+
+def _chart(text):
+    """display_tradingview_chart for "show TSLA chart", "nvidia price chart monthly" and the like."""
+    words = _words(text)
+    if not CHART_WORDS.intersection(w.lower() for w in words):
+        return None
+
+    # only known tickers or exchange-prefixed symbols, so "show AI chart" is not NASDAQ:AI
+    tickers = {w for w in words if SYMBOL.match(w) and (w in TICKERS or ":" in w)}
+    companies, rest = _take_phrases(text, COMPANY_TICKERS)
+    symbols = {TICKERS.get(t, t) for t in tickers} | {TICKERS[COMPANY_TICKERS[c]] for c in companies}
+    leftover = {w.lower() for w in _words(rest)} - {t.lower() for t in tickers}
+    if len(symbols) != 1 or not leftover <= FILLER | CHART_WORDS | set(TIMEFRAMES):
+        return None
+
+    timeframe = next((TIMEFRAMES[w] for w in leftover if w in TIMEFRAMES), "1D")
+    return Route("chart", "display_tradingview_chart", {"symbol": symbols.pop(), "timeframe": timeframe}, lambda result: result)
+
+
+def _company(text):
+    """(catalogued company named in the text or None, the other words)."""
+    names = {c.lower(): c for c in catalog.companies()}
+    found, rest = _take_phrases(text, names)
+    return (names[found[0]] if len(found) == 1 else None), {w.lower() for w in _words(rest)}
+
+
+def _list(text):
+    """list_existing_researches for "list reports", "which reports do we have for Tesla" and the like."""
+    if not {w.lower() for w in _words(text)} & {"reports", "researches"}:
+        return None
+
+    company, leftover = _company(text)
+    if not leftover <= FILLER | LIST_WORDS:
+        return None
+    args = {"company": company} if company else {}
+    return Route("list", "list_existing_researches", args, lambda result: result.removesuffix(LLM_NOTE))
+
+
+def _open(text):
+    """fetch_research for "open Nvidia.html" or "show me the Tesla report", answered by one model call."""
+    words = {w.lower() for w in _words(text)}
+    if not words & OPEN_VERBS:
+        return None
+
+    filenames = [w for w in _words(text) if w.lower().endswith(".html")]
+    if filenames:
+        row = catalog.get_file(filenames[0])
+        if len(filenames) != 1 or not words - {filenames[0].lower()} <= FILLER | OPEN_WORDS:
+            return None
+    else:
+        company, leftover = _company(text)
+        if not company or "report" not in words or not leftover <= FILLER | OPEN_WORDS:
+            return None
+        row = catalog.get_report(company)
+    if not row:
+        return None
+    return Route("open", "fetch_research", {"report_name": row["filename"]}, None)
+
+
+def route(text):
+    """The Route for a simple command, None for anything the model should handle."""
+    if not ROUTER_ENABLED or not isinstance(text, str) or len(text) > 120 or "\n" in text.strip():
+        return None
+    for match in (_chart, _list, _open):
+        found = match(text.strip())
+        if found:
+            return found
+    return None
@@ -0,0 +1,241 @@
+import os, glob, math, time, threading
+from collections import Counter
+from contextlib import contextmanager
+
+import filingstore
+from catalog import DATA_DIR, open_db
+from report import parse_report, PARTIAL_SUFFIX
+from textutils import tokenize, split_passages
+
+SEARCH_DB = os.path.join(DATA_DIR, "search.db")
+REPORT_GLOB = os.path.join("reports", "*.html")
+
+# directories are rescanned for changes at most this often (seconds)
+REFRESH_INTERVAL = 60
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id      INTEGER PRIMARY KEY,
+    path    TEXT UNIQUE NOT NULL,
+    kind    TEXT NOT NULL,
+    company TEXT NOT NULL,
+    title   TEXT NOT NULL,
+    size    INTEGER NOT NULL,
+    mtime   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passages (
+    id      INTEGER PRIMARY KEY,
+    doc_id  INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    text    TEXT NOT NULL,
+    length  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_doc ON passages (doc_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term       TEXT NOT NULL,
+    passage_id INTEGER NOT NULL,
+    tf         INTEGER NOT NULL,
+    PRIMARY KEY (term, passage_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_passage ON postings (passage_id);
+CREATE TABLE IF NOT EXISTS stats (
+    key   TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+_update_lock = threading.Lock()
+_last_refresh = 0.0
+
+
+@contextmanager
+def db():
+    conn = open_db(SEARCH_DB, SCHEMA)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _describe_report(path):
+    name = os.path.basename(path)
+    return "report", os.path.splitext(name)[0], name
+
+
+def _sources():
+    """{path: (kind, company, title)} for every indexable file: reports and the filing store's text."""
+    sources = {
+        os.path.normpath(p): _describe_report(p)
+        for p in glob.glob(REPORT_GLOB) if not p.endswith(PARTIAL_SUFFIX)
+    }
+    for row in filingstore.find():
+        # identical filings share one text file and are indexed once
+        path = os.path.normpath(filingstore.text_path(row["sha256"]))
+        sources.setdefault(path, ("filing", row["company"], f"{row['company']} {row['form']} {row['year']}"))
+    return sources
+
+
+def _passages(path, kind):
+    """(section, passage) pairs for a file."""
+    if kind == "report":
+        return [(title, p) for title, text in parse_report(path).items() for p in split_passages(text)]
+
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return [("", p) for p in split_passages(f.read())]
+
+
+def _remove(conn, doc_id):
+    conn.execute("DELETE FROM postings WHERE passage_id IN (SELECT id FROM passages WHERE doc_id = ?)", (doc_id,))
+    conn.execute("DELETE FROM passages WHERE doc_id = ?", (doc_id,))
+    conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+
+def _add(conn, path, kind, company, title):
+    stat = os.stat(path)
+    doc_id = conn.execute(
+        "INSERT INTO docs (path, kind, company, title, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+        (path, kind, company, title, stat.st_size, stat.st_mtime),
+    ).lastrowid
+
+    for section, text in _passages(path, kind):
+        terms = Counter(tokenize(text))
+        if not terms:
+            continue
+        passage_id = conn.execute(
+            "INSERT INTO passages (doc_id, section, text, length) VALUES (?, ?, ?, ?)",
+            (doc_id, section, text, sum(terms.values())),
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?)",
+            ((term, passage_id, tf) for term, tf in terms.items()),
+        )
+
+
+def _update_stats(conn):
+    n, avgdl = conn.execute("SELECT COUNT(*), AVG(length) FROM passages").fetchone()
+    conn.executemany("INSERT OR REPLACE INTO stats VALUES (?, ?)", [("n", n), ("avgdl", avgdl or 0)])
+
+
+def update_index(report_paths=None):
+    """Index new or changed files and drop deleted ones, or only the given reports.
+    Returns the number of files (re)indexed."""
+    global _last_refresh
+    with _update_lock, db() as conn:
+        if report_paths is None:
+            sources = _sources()
+            prune = True
+        else:
+            sources = {os.path.normpath(p): _describe_report(p) for p in report_paths}
+            prune = False
+
+        known = {row["path"]: row for row in conn.execute("SELECT id, path, size, mtime FROM docs")}
+        changed = 0
+        for path, (kind, company, title) in sources.items():
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            row = known.get(path)
+            if row and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+                continue
+            if row:
+                _remove(conn, row["id"])
+            _add(conn, path, kind, company, title)
+            changed += 1
+
+        if prune:
+            for path, row in known.items():
+                if path not in sources:
+                    _remove(conn, row["id"])
+                    changed += 1
+            _last_refresh = time.time()
+
+        if changed:
+            _update_stats(conn)
+        return changed
+
+
+def refresh_in_background():
+    """Rescan the sources in a thread unless a rescan is already running, queries keep using the current index."""
+    global _last_refresh
+    if _update_lock.locked():
+        return
+    # set now, so the queries arriving during the rescan do not start another one
+    _last_refresh = time.time()
+    threading.Thread(target=update_index, name="search-refresh", daemon=True).start()
+
+
+def _snippet(text, terms, width=320):
+    """Window of text around the first query term."""
+    lowered = text.lower()
+    hits = [i for i in (lowered.find(t) for t in terms) if i >= 0]
+    start = max(min(hits) - width // 4, 0) if hits else 0
+    snippet = text[start:start + width].replace("\n", " ").strip()
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
+
+
+def search(query, kind=None, company=None, limit=10):
+    """Ranked passages for the query as dicts with path, title, section, score and snippet."""
+    if time.time() - _last_refresh > REFRESH_INTERVAL:
+        refresh_in_background()
+
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    with db() as conn:
+        stats = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+        n, avgdl = stats.get("n", 0), stats.get("avgdl", 0) or 1
+        if not n:
+            return []
+
+        # the filters are applied while scoring, so only matching passages are ranked
+        where, params = "", []
+        if kind:
+            where += " AND d.kind = ?"
+            params.append(kind)
+        if company:
+            where += " AND instr(lower(d.company), ?) > 0"
+            params.append(company.lower())
+
+        scores = Counter()
+        for term in terms:
+            df = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            rows = conn.execute(
+                "SELECT p.passage_id, p.tf, s.length FROM postings p JOIN passages s ON s.id = p.passage_id "
+                "JOIN docs d ON d.id = s.doc_id WHERE p.term = ?" + where,
+                (term, *params),
+            )
+            for passage_id, tf, length in rows:
+                scores[passage_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+
+        top = scores.most_common(limit)
+        if not top:
+            return []
+        rows = {
+            row["id"]: row for row in conn.execute(
+                "SELECT s.id, d.path, d.kind, d.company, d.title, s.section, s.text FROM passages s "
+                f"JOIN docs d ON d.id = s.doc_id WHERE s.id IN ({', '.join('?' * len(top))})",
+                [passage_id for passage_id, _ in top],
+            )
+        }
+        results = []
+        for passage_id, score in top:
+            row = rows[passage_id]
+            results.append({
+                "path": row["path"],
+                "kind": row["kind"],
+                "company": row["company"],
+                "title": row["title"],
+                "section": row["section"],
+                "score": round(score, 3),
+                "snippet": _snippet(row["text"], terms),
+            })
+    return results
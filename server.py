@@ -1,17 +1,60 @@
-from fastapi import FastAPI
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
-import os, json, asyncio, traceback
-from collections import defaultdict
+import os, json, time, uuid, asyncio, traceback
+import httpx
+from contextlib import asynccontextmanager
 
-from tools import TOOLS, list_existing_researches, fetch_research, trigger_deep_research
+import catalog, search, agent_cache, metrics, router, batch, ratelimit
+from report import ENCODINGS, precompress_all
+from state import state
+from textutils import estimate_tokens, truncate_tokens
+from sessions import message_tokens
+from tools import TOOLS, REPORT_DIR, list_existing_researches, fetch_research, search_documents, recall_result
+from jobs import research_jobs, RunningElsewhere
 
 load_dotenv()
-client = OpenAI()
-app = FastAPI()
+
+MODEL = "gpt-4.1"
+MAX_ITERATIONS = 5
+
+# cheaper model that folds old turns into a summary when a history outgrows its budget
+SUMMARY_MODEL = "gpt-4.1-mini"
+
+# reports are rewritten in place by new research, so browsers revalidate every view (a 304 when unchanged)
+REPORT_CACHE_CONTROL = "no-cache"
+
+# seconds between keep-alive comments on an idle job event stream, proxies drop silent connections
+SSE_KEEPALIVE = 15
+
+# one pooled async client shared by every session, keep-alive connections are reused.
+# Its 429s and rate limit headers feed the shared OpenAI limiter
+client = AsyncOpenAI(http_client=DefaultAsyncHttpxClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    event_hooks={"response": [ratelimit.async_response_hook("openai")]}
+))
+
+# tokens reserved for a reply on top of the prompt, corrected once the usage is reported
+REPLY_TOKEN_ESTIMATE = 500
+TOOLS_TOKENS = estimate_tokens(json.dumps(TOOLS))
+
+@asynccontextmanager
+async def lifespan(app):
+    # pick up reports added or removed while the server was down
+    await asyncio.to_thread(catalog.reconcile, REPORT_DIR)
+    await asyncio.to_thread(precompress_all, REPORT_DIR)
+    await asyncio.to_thread(agent_cache.prune)
+    # building the search index over new filings can take a while, do it in the background
+    indexing = asyncio.create_task(asyncio.to_thread(search.update_index))
+    yield
+    await indexing
+    await asyncio.gather(*compactions, return_exceptions=True)
+    await client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -22,17 +65,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount reports directory
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
 app.mount("/flow", StaticFiles(directory="flow"), name="flow")
 
-# In memory conversation storage and chart queue
-conversations = {}
-chart_queue = defaultdict(list)
+# Conversation storage and chart queue, bounded in sessions and tokens. In memory by
+# default, MARS_STATE_BACKEND=sqlite shares them between uvicorn workers
+sessions = state.sessions
+# compactions running after a turn, referenced so they are not garbage collected
+compactions = set()
+# batch id -> task of the batches this worker runs
+batch_tasks = {}
 
 class ChatRequest(BaseModel):
     messages: list
     session_id: str = "default"
+    stream: bool = False
+
+class ResearchRequest(BaseModel):
+    company_name: str
+    geo_focus: str | None = None
+    industry_focus: str | None = None
+    time_horizon: str | None = None
+    # rerun every agent instead of reusing cached sections
+    refresh: bool = False
+    # only regenerate these sections of the latest stored run
+    sections: list[str] | None = None
+
+class BatchRequest(BaseModel):
+    # every company in fetch.CIKS when omitted
+    companies: list[str] | None = None
+    geo_focus: str | None = None
+    industry_focus: str | None = None
+    time_horizon: str | None = None
+    refresh: bool = False
+    max_age_days: float = batch.MAX_REPORT_AGE_DAYS
+
+def accepted_encodings(header: str) -> set:
+    """Codings the client accepts, from an Accept-Encoding header"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+# Reports, precompressed and validated against the catalog's content hash
+@app.api_route("/reports/{filename}", methods=["GET", "HEAD"])
+async def serve_report(filename: str, request: Request):
+    path = os.path.join(REPORT_DIR, filename)
+    row = await asyncio.to_thread(catalog.get_file, filename)
+    if not row or not row["etag"]:
+        # not catalogued yet, e.g. copied in while the server runs
+        if filename != os.path.basename(filename) or not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Report not found")
+        return FileResponse(path)
+
+    # every encoding is a different representation, hence its own strong ETag
+    headers = {"Cache-Control": REPORT_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag == "*" or tag.strip('"').rsplit("-", 1)[0] == row["etag"]:
+            # answered from the catalog alone, the file is never opened
+            return Response(status_code=304, headers={**headers, "ETag": tag if tag != "*" else f'"{row["etag"]}"'})
+
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Report not found")
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    mtime = os.path.getmtime(path)
+    for encoding, suffix in ENCODINGS.items():
+        variant = path + suffix
+        if encoding in accepted and os.path.exists(variant) and os.path.getmtime(variant) >= mtime:
+            return FileResponse(variant, media_type="text/html; charset=utf-8", headers={
+                **headers, "Content-Encoding": encoding, "ETag": f'"{row["etag"]}-{encoding}"',
+            })
+    return FileResponse(path, media_type="text/html; charset=utf-8", headers={**headers, "ETag": f'"{row["etag"]}"'})
 
 @app.get("/")
 async def serve_index():
@@ -40,14 +147,42 @@ async def serve_index():
     return FileResponse("index.html")
 
 # execution loop for tool calls
-async def execute_tool(tool_name: str, args: dict, session_id: str) -> str:
+async def execute_tool(tool_name: str, args: dict, session) -> str:
     """Execute the tool and return result as string"""
+    # blocking file I/O runs on the default thread pool to keep the event loop free
     if tool_name == "list_existing_researches":
-        return list_existing_researches()
+        return await asyncio.to_thread(list_existing_researches, args)
     elif tool_name == "fetch_research":
-        return fetch_research(args)
+        return await asyncio.to_thread(fetch_research, args)
+    elif tool_name == "search_documents":
+        return await asyncio.to_thread(search_documents, args)
+    elif tool_name == "recall_result":
+        text = session.recall(args.get("handle", ""))
+        return await asyncio.to_thread(recall_result, text, args)
     elif tool_name == "trigger_deep_research":
-        return await trigger_deep_research(args)
+        try:
+            job, created = await research_jobs.submit(args)
+        except RunningElsewhere as e:
+            return str(e)
+        if not created:
+            return f"Research for {job.args['company_name']} is already in progress as job {job.id}. Status: /jobs/{job.id}, live progress: /jobs/{job.id}/events"
+        return (
+            f"Research for {job.args['company_name']} started as job {job.id}. It runs in the background; status: /jobs/{job.id}, "
+            f"live progress: /jobs/{job.id}/events. Finished sections can be read early in /reports/{job.args['company_name'].strip()}.partial.html"
+        )
+    elif tool_name == "refresh_research":
+        try:
+            job, created = await research_jobs.submit(args, kind="refresh")
+        except RunningElsewhere as e:
+            return str(e)
+        if not created:
+            return f"This update of {job.args['company_name']} is already in progress as job {job.id}. Status: /jobs/{job.id}, live progress: /jobs/{job.id}/events"
+        return f"Update of {job.args['company_name']} started as job {job.id}. It runs in the background; status: /jobs/{job.id}, live progress: /jobs/{job.id}/events"
+    elif tool_name == "get_research_status":
+        job = await research_jobs.get(args.get("job_id", ""))
+        if not job:
+            return f"No research job found with id '{args.get('job_id')}'."
+        return json.dumps(job.to_dict())
     elif tool_name == "display_tradingview_chart":
         # Queue the chart for display without returning HTML to LLM
         symbol = args.get("symbol", "").upper()
@@ -56,7 +191,7 @@ async def execute_tool(tool_name: str, args: dict, session_id: str) -> str:
         if ":" not in symbol:
             symbol = f"NASDAQ:{symbol}"
         
-        chart_queue[session_id].append({
+        session.charts.append({
             "symbol": symbol,
             "timeframe": timeframe
         })
@@ -65,86 +200,294 @@ async def execute_tool(tool_name: str, args: dict, session_id: str) -> str:
     else:
         return f"Unknown tool: {tool_name}"
 
-# chat endpoint
-@app.post("/chat")
-async def chat(req: ChatRequest):
+# one model round trip, streamed token by token when asked
+async def model_turn(messages: list, stream: bool):
+    """Yield token events while streaming, then the complete assistant message."""
+    # chat turns go ahead of research and batches waiting for the same quota
+    limiter = ratelimit.limiters["openai"]
+    reserved = sum(message_tokens(m) for m in messages) + TOOLS_TOKENS + REPLY_TOKEN_ESTIMATE
+    await limiter.acquire(reserved, priority="interactive")
+    # what the call used as far as known, the reservation is corrected by it however the call ends
+    used = 0
     try:
-        session_id = req.session_id
-        
-        if session_id not in conversations:
-            conversations[session_id] = []
+        async for event in _model_turn(messages, stream, reserved):
+            if event["type"] == "usage":
+                used = event["total_tokens"] if event["total_tokens"] is not None else used
+            else:
+                yield event
+    finally:
+        limiter.settle(reserved, used)
 
-        chart_queue[session_id] = []
-        
-        user_message = req.messages[-1] 
-        conversations[session_id].append(user_message)
-        
-        messages_to_send = conversations[session_id].copy()
-        
-        response = client.chat.completions.create(
-            model="gpt-4.1", 
-            messages=messages_to_send,
-            tools=TOOLS
-        )
+async def _model_turn(messages: list, stream: bool, reserved: int):
+    """model_turn without the rate limiting, "usage" events carry the tokens used so far"""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.chat.completions.create(model=MODEL, messages=messages, tools=TOOLS)
+        metrics.observe("mars_openai_seconds", time.perf_counter() - started, model=MODEL, stream="false")
+        metrics.record_usage(MODEL, getattr(response, "usage", None))
+        yield {"type": "usage", "total_tokens": getattr(getattr(response, "usage", None), "total_tokens", None) or reserved}
+        message = response.choices[0].message
+        yield {
+            "type": "message",
+            "content": message.content or "",
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": "function",
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                } for tc in message.tool_calls or []
+            ]
+        }
+        return
 
-        max_iterations = 5  
-        iteration = 0
-        
-        while iteration < max_iterations:
-            message = response.choices[0].message
-            assistant_text = message.content or ""
-            tool_calls = message.tool_calls if hasattr(message, 'tool_calls') else None
-
-            if not tool_calls:
-                conversations[session_id].append({
-                    "role": "assistant",
-                    "content": assistant_text
-                })
-                
-                # Get charts and then clear the queue
-                charts = chart_queue.get(session_id, []).copy()
-                chart_queue[session_id] = []  # Clear after getting
-                
-                return {
-                    "response": assistant_text or "I'm not sure how to help with that.",
-                    "charts": charts
-                }
-
-            conversations[session_id].append({
+    content = []
+    tool_calls = {}
+    response = await client.chat.completions.create(
+        model=MODEL, messages=messages, tools=TOOLS, stream=True,
+        # token counts arrive in a last chunk without choices
+        stream_options={"include_usage": True}
+    )
+    # the prompt is spent once the stream starts, cut off streams count the reply so far
+    prompt = reserved - REPLY_TOKEN_ESTIMATE
+    streamed = 0
+    yield {"type": "usage", "total_tokens": prompt}
+    async for chunk in response:
+        if not chunk.choices:
+            metrics.record_usage(MODEL, getattr(chunk, "usage", None))
+            yield {"type": "usage", "total_tokens": getattr(getattr(chunk, "usage", None), "total_tokens", None)}
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            content.append(delta.content)
+            streamed += len(delta.content)
+            yield {"type": "usage", "total_tokens": prompt + streamed // 4}
+            yield {"type": "token", "content": delta.content}
+
+        # tool calls arrive in fragments keyed by index
+        for tc in delta.tool_calls or []:
+            call = tool_calls.setdefault(tc.index, {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function and tc.function.name:
+                call["function"]["name"] += tc.function.name
+            if tc.function and tc.function.arguments:
+                call["function"]["arguments"] += tc.function.arguments
+
+    metrics.observe("mars_openai_seconds", time.perf_counter() - started, model=MODEL, stream="true")
+    yield {
+        "type": "message",
+        "content": "".join(content),
+        "tool_calls": [tool_calls[i] for i in sorted(tool_calls)]
+    }
+
+async def summarize_history(summary: str, messages: list) -> str:
+    """New running summary of a conversation from the previous one and the turns being folded in"""
+    transcript = "\n".join(
+        f"{m['role']}: {truncate_tokens(m['content'], 400)}" for m in messages if m.get("content")
+    )
+    # runs after the answer is sent, no need to go ahead of research
+    limiter = ratelimit.limiters["openai"]
+    reserved = estimate_tokens(summary or "") + estimate_tokens(transcript) + 400
+    await limiter.acquire(reserved)
+    used = 0
+    try:
+        response = await client.chat.completions.create(model=SUMMARY_MODEL, messages=[{
+            "role": "user",
+            "content": (
+                "Update the running summary of a conversation between a user and a company research assistant. "
+                "Keep companies, report file names, job ids, figures and open questions. At most 200 words.\n\n"
+                f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+            ),
+        }])
+        used = getattr(getattr(response, "usage", None), "total_tokens", None)
+    finally:
+        limiter.settle(reserved, used)
+    metrics.record_usage(SUMMARY_MODEL, getattr(response, "usage", None), kind="summary")
+    return response.choices[0].message.content
+
+async def timed_tool(tool_name: str, args: dict, session, steps: list) -> str:
+    """execute_tool, timed into /metrics and the turn's trace"""
+    started = time.perf_counter()
+    ok = False
+    try:
+        # API calls a tool makes are part of the chat turn
+        with ratelimit.priority("interactive"):
+            result = await execute_tool(tool_name, args, session)
+        ok = True
+        return result
+    except Exception:
+        metrics.inc("mars_tool_errors_total", tool=tool_name)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe("mars_tool_seconds", seconds, tool=tool_name)
+        steps.append({"tool": tool_name, "seconds": round(seconds, 3), "ok": ok})
+
+async def end_turn(session, trace, started):
+    """Save the session once the user has the answer. Bulky tool results become
+    handles right away, old turns are summarized in the background"""
+    trace["seconds"] = round(time.perf_counter() - started, 3)
+    metrics.observe("mars_chat_turn_seconds", trace["seconds"])
+    await asyncio.to_thread(metrics.append_trace, "chat", trace)
+
+    session.compact_tool_results()
+    await asyncio.to_thread(sessions.save, session)
+    if session.tokens() > sessions.token_budget:
+        task = asyncio.create_task(sessions.compact(session, summarize_history))
+        compactions.add(task)
+        task.add_done_callback(compactions.discard)
+
+# tool loop for one user turn, the last event is always "done"
+async def chat_events(session_id: str, user_message: dict, stream: bool = False):
+    session = await asyncio.to_thread(sessions.get, session_id)
+    # hard cap on the request size when summaries cannot keep up, old turns are dropped
+    await sessions.compact(session, budget=2 * sessions.token_budget)
+
+    session.charts = []
+    session.messages.append(user_message)
+    turn_started = time.perf_counter()
+    trace = {"session_id": session_id, "started_at": time.time(), "iterations": []}
+
+    # simple commands run their tool without asking the model which one
+    route = await asyncio.to_thread(router.route, user_message.get("content"))
+    if route:
+        trace["routed"] = route.intent
+        metrics.inc("mars_routed_total", intent=route.intent)
+        step = {"model_seconds": 0, "tools": []}
+        trace["iterations"].append(step)
+        tool_call_id = f"route_{uuid.uuid4().hex[:12]}"
+        session.messages.append({
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{
+                "id": tool_call_id,
+                "type": "function",
+                "function": {"name": route.tool, "arguments": json.dumps(route.args)}
+            }]
+        })
+        yield {"type": "tool_call", "id": tool_call_id, "name": route.tool, "arguments": route.args}
+        try:
+            tool_result = await timed_tool(route.tool, route.args, session, step["tools"])
+        except Exception as e:
+            traceback.print_exc()
+            tool_result = f"Tool {route.tool} failed: {e}"
+            route = route._replace(reply=None)
+        session.messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": tool_result})
+        yield {"type": "tool_result", "id": tool_call_id, "name": route.tool}
+
+        # answered from a template, otherwise one model call reads the result
+        if route.reply:
+            response = route.reply(tool_result)
+            session.messages.append({"role": "assistant", "content": response})
+            await end_turn(session, trace, turn_started)
+            charts = session.charts
+            session.charts = []
+            yield {"type": "done", "response": response, "charts": charts}
+            return
+
+    for iteration in range(MAX_ITERATIONS + 1):
+        started = time.perf_counter()
+        step = {"model_seconds": 0, "tools": []}
+        trace["iterations"].append(step)
+
+        message = None
+        async for event in model_turn(session.messages, stream):
+            if event["type"] == "message":
+                message = event
+            else:
+                yield event
+        step["model_seconds"] = round(time.perf_counter() - started, 3)
+
+        if not message["tool_calls"]:
+            session.messages.append({
                 "role": "assistant",
-                "content": "",
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    } for tc in tool_calls
-                ]
+                "content": message["content"]
+            })
+            metrics.observe("mars_chat_iteration_seconds", time.perf_counter() - started)
+            await end_turn(session, trace, turn_started)
+
+            # Get charts and then clear the queue
+            charts = session.charts
+            session.charts = []  # Clear after getting
+
+            yield {
+                "type": "done",
+                "response": message["content"] or "I'm not sure how to help with that.",
+                "charts": charts
+            }
+            return
+
+        if iteration == MAX_ITERATIONS:
+            break
+
+        session.messages.append({
+            "role": "assistant",
+            "content": "",
+            "tool_calls": message["tool_calls"]
+        })
+
+        calls = []
+        for tool_call in message["tool_calls"]:
+            tool_name = tool_call["function"]["name"]
+            args = json.loads(tool_call["function"]["arguments"] or "{}")
+            calls.append((tool_call["id"], tool_name, args))
+            yield {"type": "tool_call", "id": tool_call["id"], "name": tool_name, "arguments": args}
+
+        # tool calls of one turn are independent, run them together
+        results = await asyncio.gather(
+            *(timed_tool(tool_name, args, session, step["tools"]) for _, tool_name, args in calls),
+            return_exceptions=True
+        )
+
+        # results go back in the order the model asked for them
+        for (tool_call_id, tool_name, _), tool_result in zip(calls, results):
+            if isinstance(tool_result, Exception):
+                traceback.print_exception(tool_result)
+                tool_result = f"Tool {tool_name} failed: {tool_result}"
+
+            session.messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call_id,
+                "content": tool_result
             })
+            yield {"type": "tool_result", "id": tool_call_id, "name": tool_name}
+        metrics.observe("mars_chat_iteration_seconds", time.perf_counter() - started)
 
-            for tool_call in tool_calls:
-                tool_name = tool_call.function.name
-                args = json.loads(tool_call.function.arguments or "{}")
-                tool_result = await execute_tool(tool_name, args, session_id)
+    await end_turn(session, trace, turn_started)
+    yield {
+        "type": "done",
+        "response": "Processing completed but may be incomplete. Please try again.",
+        "charts": []
+    }
 
-                conversations[session_id].append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": tool_result
-                })
+async def stream_chat(session_id: str, user_message: dict):
+    """Newline delimited JSON events for the browser"""
+    try:
+        async for event in chat_events(session_id, user_message, stream=True):
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        traceback.print_exc()
+        yield json.dumps({"type": "error", "error": "Backend error. Check server logs.", "details": str(e)}) + "\n"
 
-            response = client.chat.completions.create(
-                model="gpt-4.1",
-                messages=conversations[session_id],
-                tools=TOOLS
-            )
-            
-            iteration += 1
+# chat endpoint
+@app.post("/chat")
+async def chat(req: ChatRequest):
+    user_message = req.messages[-1]
+    if req.stream:
+        return StreamingResponse(stream_chat(req.session_id, user_message), media_type="application/x-ndjson")
 
-        return {"response": "Processing completed but may be incomplete. Please try again."}
+    try:
+        async for event in chat_events(req.session_id, user_message):
+            if event["type"] == "done":
+                return {"response": event["response"], "charts": event["charts"]}
 
     except Exception as e:
         traceback.print_exc()
@@ -154,9 +497,7 @@ async def chat(req: ChatRequest):
 @app.post("/clear")
 async def clear_conversation(session_id: str = "default"):
     """Clear conversation history for a session"""
-    if session_id in conversations:
-        conversations[session_id] = []
-        chart_queue[session_id] = []
+    if await asyncio.to_thread(sessions.clear, session_id):
         return {"message": f"Conversation history cleared for session: {session_id}"}
     return {"message": "No conversation found for this session"}
 
@@ -164,4 +505,92 @@ async def clear_conversation(session_id: str = "default"):
 @app.get("/history/{session_id}")
 async def get_history(session_id: str = "default"):
     """Retrieve conversation history"""
-    return {"history": conversations.get(session_id, [])}
\ No newline at end of file
+    session = await asyncio.to_thread(sessions.peek, session_id)
+    return {"history": session.messages if session else []}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics of this worker process"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/jobs")
+async def create_job(req: ResearchRequest):
+    """Start a deep research job, or join the identical one already running"""
+    try:
+        job, created = await research_jobs.submit(req.model_dump(), kind="refresh" if req.sections else "research")
+    except RunningElsewhere as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"created": created, **job.to_dict()}
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """List known research jobs"""
+    return {"jobs": await research_jobs.list()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and result of a research job"""
+    job = await research_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+async def job_event_stream(job_id: str, after: int):
+    """Server-Sent Events of a job, ending with its job_done or job_failed event"""
+    async for seq, event in research_jobs.follow(job_id, after, SSE_KEEPALIVE):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Live progress of a research job: agents starting, their log lines, finished sections and the partial report"""
+    if not await research_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    # a reconnecting EventSource resumes after the last event it saw
+    last_event_id = request.headers.get("last-event-id", "")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        job_event_stream(job_id, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/batches")
+async def create_batch(req: BatchRequest):
+    """Research many companies in the background, resuming the same batch if it ran before"""
+    params = batch.batch_params(req.geo_focus, req.industry_focus, req.time_horizon)
+    record = await asyncio.to_thread(
+        batch.new_batch, req.companies or sorted(batch.CIKS), params, req.refresh, req.max_age_days
+    )
+    task = batch_tasks.get(record["batch_id"])
+    if task and not task.done():
+        current = await asyncio.to_thread(batch.load, record["batch_id"])
+        return {"created": False, **batch.summary(current or record)}
+    task = asyncio.create_task(batch.run_batch(record))
+    batch_tasks[record["batch_id"]] = task
+    task.add_done_callback(lambda _: batch_tasks.pop(record["batch_id"], None))
+    return {"created": True, **batch.summary(record)}
+
+
+@app.get("/batches")
+async def list_batches():
+    """Checkpointed batches, most recent first"""
+    return {"batches": await asyncio.to_thread(batch.list_batches)}
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Status of every company of a batch"""
+    record = await asyncio.to_thread(batch.load, batch_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return record
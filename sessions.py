@@ -0,0 +1,198 @@
+import os, time, hashlib, traceback
+from collections import OrderedDict
+
+from textutils import estimate_tokens, truncate_tokens
+
+# sessions kept in memory, the least recently used one is evicted beyond this
+MAX_SESSIONS = int(os.getenv("MARS_MAX_SESSIONS", "1000"))
+# sessions idle for longer than this (seconds) are dropped
+SESSION_IDLE_TTL = int(os.getenv("MARS_SESSION_TTL", str(6 * 3600)))
+# history sent to the model per request, older turns are summarized beyond it
+HISTORY_TOKEN_BUDGET = int(os.getenv("MARS_HISTORY_TOKENS", "16000"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# tool results longer than this (characters) are swapped for a digest once their turn is over
+COMPACT_RESULT_CHARS = 1500
+RESULT_DIGEST_TOKENS = 80
+# full results kept per session for recall_result, oldest dropped first
+MAX_STORED_RESULTS = 50
+
+
+def message_tokens(message):
+    """Estimated tokens of a chat message including tool call arguments."""
+    tokens = estimate_tokens(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(call["function"]["name"] + call["function"]["arguments"])
+    return tokens + 4
+
+
+def is_summary(message):
+    return message["role"] == "system" and (message.get("content") or "").startswith(SUMMARY_PREFIX)
+
+
+def split_turns(messages):
+    """Messages grouped into turns, each starting at a user message. A tool call and
+    its results always end up in the same turn, so turns can be dropped whole."""
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class Session:
+    def __init__(self, session_id=None):
+        self.id = session_id
+        self.messages = []
+        # charts queued by tools during the current turn
+        self.charts = []
+        self.last_used = time.time()
+        self.compacting = False
+        # handle -> full text of a tool result that was compacted out of the history
+        self.results = OrderedDict()
+
+    def tokens(self):
+        return sum(message_tokens(m) for m in self.messages)
+
+    def to_dict(self):
+        """What a shared state backend persists, charts only live for one turn and are left out."""
+        return {"messages": self.messages, "results": list(self.results.items()), "last_used": self.last_used}
+
+    @classmethod
+    def from_dict(cls, session_id, data):
+        session = cls(session_id)
+        session.messages = data["messages"]
+        session.results = OrderedDict(data["results"])
+        session.last_used = data["last_used"]
+        return session
+
+    def compact_tool_results(self):
+        """Replace bulky tool results in the history by a short digest and a handle.
+
+        Call once the turn that needed them is answered. Returns the number replaced.
+        """
+        names = {
+            call["id"]: call["function"]["name"]
+            for m in self.messages for call in m.get("tool_calls") or []
+        }
+        replaced = 0
+        for message in self.messages:
+            content = message.get("content") or ""
+            if message["role"] != "tool" or len(content) <= COMPACT_RESULT_CHARS:
+                continue
+            handle = "res-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:10]
+            self.results[handle] = content
+            self.results.move_to_end(handle)
+            digest = truncate_tokens(" ".join(content.split()), RESULT_DIGEST_TOKENS)
+            message["content"] = (
+                f"[{names.get(message.get('tool_call_id'), 'tool')} result of about {estimate_tokens(content)} tokens, "
+                f"stored as {handle}. Digest: {digest} Call recall_result with this handle to read it again.]"
+            )
+            replaced += 1
+
+        while len(self.results) > MAX_STORED_RESULTS:
+            self.results.popitem(last=False)
+        return replaced
+
+    def recall(self, handle):
+        """Full text of a compacted tool result, None once it has been dropped."""
+        return self.results.get(handle)
+
+
+class SessionStore:
+    """Chat sessions with LRU and idle-TTL eviction and a token budget per history."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL, token_budget=HISTORY_TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """The session, created if it does not exist, marked as most recently used."""
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session(session_id)
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        return session
+
+    def peek(self, session_id):
+        """The session if it exists, without touching it."""
+        return self._sessions.get(session_id)
+
+    def save(self, session):
+        """Persist a session after changing it, nothing to do when sessions live in memory."""
+
+    def clear(self, session_id):
+        # a compaction still running on the old session object then has no effect
+        return self._sessions.pop(session_id, None) is not None
+
+    async def replace_prefix(self, session, prefix, head):
+        """Swap the first messages of a session, prefix as they were when a compaction
+        read them, for head. False when the session was cleared meanwhile or its
+        history no longer starts with prefix, the compaction is dropped then."""
+        if self._sessions.get(session.id) is not session or session.messages[:len(prefix)] != prefix:
+            return False
+        session.messages[:len(prefix)] = head
+        return True
+
+    def _evict(self):
+        cutoff = time.time() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) < self.max_sessions and session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+
+    async def compact(self, session, summarize=None, budget=None):
+        """Fold the oldest turns into a summary once the history exceeds budget tokens.
+
+        Keeps the newest turns that fit in half the budget, so compaction does not
+        run again on the next turn. summarize(previous_summary, messages) is an async
+        callable returning the new summary text, without it (or if it fails) the old
+        turns are dropped. Returns True if the history was shortened.
+        """
+        budget = budget or self.token_budget
+        if session.compacting or session.tokens() <= budget:
+            return False
+
+        session.compacting = True
+        try:
+            messages = list(session.messages)
+            has_summary = bool(messages) and is_summary(messages[0])
+            summary = messages[0]["content"][len(SUMMARY_PREFIX):] if has_summary else ""
+            turns = split_turns(messages[1:] if has_summary else messages)
+
+            keep, used = 0, 0
+            for turn in reversed(turns):
+                size = sum(message_tokens(m) for m in turn)
+                if keep and used + size > budget // 2:
+                    break
+                keep += 1
+                used += size
+            old = [m for turn in turns[:len(turns) - keep] for m in turn]
+            if not old:
+                return False
+
+            if summarize:
+                try:
+                    summary = await summarize(summary, old) or summary
+                except Exception:
+                    traceback.print_exc()
+
+            # only the summarized prefix is replaced, messages appended meanwhile stay after it
+            prefix = messages[:int(has_summary) + len(old)]
+            head = [{"role": "system", "content": SUMMARY_PREFIX + summary}] if summary else []
+            if not await self.replace_prefix(session, prefix, head):
+                return False
+            print(f"🗜️ Compacted {len(old)} messages of history ({len(session.messages)} left)")
+            return True
+        finally:
+            session.compacting = False
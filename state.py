@@ -0,0 +1,189 @@
+import os, json, time, asyncio
+from contextlib import contextmanager
+
+from catalog import DATA_DIR, open_db
+from sessions import Session, SessionStore, MAX_SESSIONS, SESSION_IDLE_TTL, HISTORY_TOKEN_BUDGET
+
+# "memory" keeps everything in this process (one uvicorn worker),
+# "sqlite" shares sessions, jobs and locks between the workers on one machine
+STATE_BACKEND = os.getenv("MARS_STATE_BACKEND", "memory")
+STATE_DB = os.path.join(DATA_DIR, "state.db")
+
+# job records kept for /jobs lookups
+MAX_JOB_RECORDS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id        TEXT PRIMARY KEY,
+    data      TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS locks (
+    name       TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class MemoryState:
+    """Process-local state, the default when the server runs as a single worker."""
+
+    def __init__(self):
+        self.sessions = SessionStore()
+        self._locks = {}
+        self._jobs = {}
+
+    def acquire(self, name, owner, ttl):
+        """Take the lock name for owner for ttl seconds. Returns None when taken,
+        otherwise the owner currently holding it."""
+        holder, expires_at = self._locks.get(name, (None, 0))
+        if holder not in (None, owner) and expires_at > time.time():
+            return holder
+        self._locks[name] = (owner, time.time() + ttl)
+        return None
+
+    def release(self, name, owner):
+        if self._locks.get(name, (None, 0))[0] == owner:
+            del self._locks[name]
+
+    def put_job(self, record):
+        self._jobs.pop(record["job_id"], None)
+        self._jobs[record["job_id"]] = record
+        while len(self._jobs) > MAX_JOB_RECORDS:
+            del self._jobs[next(iter(self._jobs))]
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        return list(self._jobs.values())
+
+
+@contextmanager
+def db():
+    conn = open_db(STATE_DB, SCHEMA)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in data/state.db, loaded at the start of a request and saved after changes."""
+
+    def __len__(self):
+        with db() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _load(self, conn, session_id):
+        row = conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return Session.from_dict(session_id, json.loads(row["data"])) if row else None
+
+    def get(self, session_id):
+        with db() as conn:
+            self._evict(conn)
+            session = self._load(conn, session_id) or Session(session_id)
+            session.last_used = time.time()
+            self._write(conn, session)
+        return session
+
+    def peek(self, session_id):
+        with db() as conn:
+            return self._load(conn, session_id)
+
+    def save(self, session):
+        with db() as conn:
+            self._write(conn, session)
+
+    def clear(self, session_id):
+        with db() as conn:
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    async def replace_prefix(self, session, prefix, head):
+        return await asyncio.to_thread(self._replace_prefix, session, prefix, head)
+
+    def _replace_prefix(self, session, prefix, head):
+        with db() as conn:
+            # the stored record is read again under the write lock, so turns saved
+            # while the summary was written are kept and a cleared session stays cleared
+            conn.execute("BEGIN IMMEDIATE")
+            stored = self._load(conn, session.id)
+            if stored is None or stored.messages[:len(prefix)] != prefix:
+                return False
+            stored.messages[:len(prefix)] = head
+            self._write(conn, stored)
+        session.messages = stored.messages
+        return True
+
+    def _write(self, conn, session):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+            (session.id, json.dumps(session.to_dict()), session.last_used),
+        )
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM sessions WHERE last_used < ?", (time.time() - self.idle_ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE id NOT IN (SELECT id FROM sessions ORDER BY last_used DESC LIMIT ?)",
+            (self.max_sessions - 1,),
+        )
+
+
+class SqliteState(MemoryState):
+    """State shared through SQLite by every worker process on the machine."""
+
+    def __init__(self):
+        self.sessions = SqliteSessionStore(MAX_SESSIONS, SESSION_IDLE_TTL, HISTORY_TOKEN_BUDGET)
+
+    def acquire(self, name, owner, ttl):
+        with db() as conn:
+            # taken before reading, so two workers cannot both see the lock as free
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+            if row and row["owner"] != owner and row["expires_at"] > time.time():
+                return row["owner"]
+            conn.execute("INSERT OR REPLACE INTO locks VALUES (?, ?, ?)", (name, owner, time.time() + ttl))
+        return None
+
+    def release(self, name, owner):
+        with db() as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def put_job(self, record):
+        with db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)",
+                (record["job_id"], json.dumps(record), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY updated_at DESC LIMIT ?)",
+                (MAX_JOB_RECORDS,),
+            )
+
+    def get_job(self, job_id):
+        with db() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list_jobs(self):
+        with db() as conn:
+            return [json.loads(row["data"]) for row in conn.execute("SELECT data FROM jobs ORDER BY updated_at")]
+
+
+BACKENDS = {
+    "memory": MemoryState,
+    "sqlite": SqliteState,
+}
+
+if STATE_BACKEND not in BACKENDS:
+    raise ValueError(f"MARS_STATE_BACKEND must be one of {', '.join(BACKENDS)}, got '{STATE_BACKEND}'")
+
+state = BACKENDS[STATE_BACKEND]()
@@ -0,0 +1,150 @@
+import re
+
+import filingstore
+
+# standard 10-K items in filing order
+ITEMS = {
+    "1": "Business",
+    "1A": "Risk Factors",
+    "1B": "Unresolved Staff Comments",
+    "1C": "Cybersecurity",
+    "2": "Properties",
+    "3": "Legal Proceedings",
+    "4": "Mine Safety Disclosures",
+    "5": "Market for Registrant's Common Equity",
+    "6": "Reserved",
+    "7": "Management's Discussion and Analysis",
+    "7A": "Quantitative and Qualitative Disclosures About Market Risk",
+    "8": "Financial Statements and Supplementary Data",
+    "9": "Changes in and Disagreements with Accountants",
+    "9A": "Controls and Procedures",
+    "9B": "Other Information",
+    "9C": "Disclosure Regarding Foreign Jurisdictions that Prevent Inspections",
+    "10": "Directors, Executive Officers and Corporate Governance",
+    "11": "Executive Compensation",
+    "12": "Security Ownership",
+    "13": "Certain Relationships and Related Transactions",
+    "14": "Principal Accountant Fees and Services",
+    "15": "Exhibits and Financial Statement Schedules",
+    "16": "Form 10-K Summary",
+}
+
+# "Item 7." / "ITEM 1A:" / "Item 7A -" at the start of a line of the extracted text
+HEADING_RE = re.compile(rb"(?im)^[ \t]*item[ \t]*(\d{1,2}[abc]?)\b[ \t]*(?:\.|:|-|\xe2\x80\x93|\xe2\x80\x94)?")
+
+
+def extract_sections(sha):
+    """[(item, start, end)] byte ranges of the 10-K items in a stored filing's text.
+
+    Scans the memory-mapped text with one regex pass, so memory stays constant
+    whatever the filing size. Every item heading also appears in the table of
+    contents, so for each item the occurrence with the longest body wins.
+    """
+    with filingstore.open_text(sha) as view:
+        size = len(view)
+        headings = [
+            (m.start(), m.group(1).decode().upper())
+            for m in HEADING_RE.finditer(view)
+            if m.group(1).decode().upper() in ITEMS
+        ]
+
+    best = {}
+    for n, (start, item) in enumerate(headings):
+        end = headings[n + 1][0] if n + 1 < len(headings) else size
+        if end - start > best.get(item, (0, 0))[1] - best.get(item, (0, 0))[0]:
+            best[item] = (start, end)
+
+    # clip overlapping ranges at the next chosen heading
+    sections = sorted((start, end, item) for item, (start, end) in best.items())
+    result = []
+    for n, (start, end, item) in enumerate(sections):
+        if n + 1 < len(sections):
+            end = min(end, sections[n + 1][0])
+        if end > start:
+            result.append((item, start, end))
+    return result
+
+
+def index_filing(sha):
+    """Extract and store the item ranges of one filing. Returns the number of items found."""
+    sections = extract_sections(sha)
+    with filingstore.db() as conn:
+        conn.execute("DELETE FROM sections WHERE sha256 = ?", (sha,))
+        conn.executemany(
+            "INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+            ((sha, item, ITEMS[item], start, end) for item, start, end in sections),
+        )
+    return len(sections)
+
+
+def index_all():
+    """Extract items for stored 10-K filings that have not been processed yet."""
+    with filingstore.db() as conn:
+        pending = [row[0] for row in conn.execute(
+            "SELECT DISTINCT sha256 FROM filings WHERE form LIKE '10-K%' "
+            "AND sha256 NOT IN (SELECT DISTINCT sha256 FROM sections)"
+        )]
+    for sha in pending:
+        index_filing(sha)
+    return len(pending)
+
+
+def section_rows(company, items, years):
+    """[(filing, section)] rows of the requested items in a company's latest 10-Ks, newest first."""
+    company = filingstore.match_company(company)
+    if not company:
+        return []
+
+    rows = []
+    marks = ",".join("?" * len(items))
+    with filingstore.db() as conn:
+        filings = conn.execute(
+            "SELECT company, year, sha256 FROM filings WHERE company = ? AND form = '10-K' "
+            "GROUP BY year ORDER BY year DESC LIMIT ?",
+            (company, years),
+        ).fetchall()
+        for filing in filings:
+            for section in conn.execute(
+                f"SELECT item, title, start, end FROM sections WHERE sha256 = ? AND item IN ({marks})",
+                (filing["sha256"], *items),
+            ):
+                rows.append((dict(filing), dict(section)))
+
+    order = {item: n for n, item in enumerate(items)}
+    rows.sort(key=lambda r: (-int(r[0]["year"]), order[r[1]["item"]]))
+    return rows
+
+
+def get_sections(company, items, years=3, max_chars=None):
+    """Item texts from a company's latest annual reports, as dicts with company, year, item, title and text.
+
+    Only the bytes of the requested items are read from the mapped text file,
+    at most max_chars of each.
+    """
+    results = []
+    rows = section_rows(company, items, years)
+    for filing, section in rows:
+        end = section["end"] if max_chars is None else min(section["end"], section["start"] + max_chars)
+        results.append({
+            "company": filing["company"],
+            "year": filing["year"],
+            "item": section["item"],
+            "title": section["title"],
+            "text": filingstore.read_text(filing["sha256"], section["start"], end),
+        })
+    return results
+
+
+def format_sections(sections):
+    return "\n\n".join(
+        f"Source: {s['company']} Form 10-K {s['year']}, Item {s['item']}. {s['title']}\n{s['text'].strip()}"
+        for s in sections
+    )
+
+
+def filing_context(company, items=("7", "7A", "8", "1A"), years=3, max_chars=80000):
+    """Requested items of the latest 10-Ks as one context string for a report writer, "" if none are stored."""
+    available = len(section_rows(company, items, years))
+    if not available:
+        return ""
+    return format_sections(get_sections(company, items, years, max_chars=max_chars // available))
@@ -0,0 +1,14 @@
+import os, sys
+
+import pytest
+
+# the modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, data/ and reports/ are relative to the working directory."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "reports").mkdir()
+    return tmp_path
@@ -0,0 +1,45 @@
+import time
+
+import agent_cache
+from agent_cache import HOUR, DAY
+
+ACME = {"company_name": "Acme", "geo_focus": "Global", "time_horizon": "last 12 months"}
+
+
+def age(monkeypatch, seconds):
+    now = time.time()
+    monkeypatch.setattr(agent_cache.time, "time", lambda: now + seconds)
+
+
+def test_keys_ignore_case_and_whitespace():
+    assert agent_cache.cache_key("news", ACME) == agent_cache.cache_key("news", {**ACME, "company_name": " ACME "})
+    assert agent_cache.cache_key("news", ACME) != agent_cache.cache_key("market", ACME)
+    assert agent_cache.cache_key("news", ACME) != agent_cache.cache_key("news", {**ACME, "geo_focus": "Europe"})
+
+
+def test_each_section_expires_after_its_ttl(workdir, monkeypatch):
+    agent_cache.put("news", ACME, "Acme opened a store.", ["https://example.com/news"])
+    agent_cache.put("financials", ACME, "Revenue grew.")
+    assert agent_cache.get("news", ACME)["sources"] == ["https://example.com/news"]
+
+    age(monkeypatch, 7 * HOUR)
+    assert agent_cache.get("news", ACME) is None
+    assert agent_cache.get("news", ACME, max_age=8 * HOUR)["content"] == "Acme opened a store."
+    assert agent_cache.get("financials", ACME)["content"] == "Revenue grew."
+
+    age(monkeypatch, 15 * DAY)
+    assert agent_cache.get("financials", ACME) is None
+    assert agent_cache.prune() == 2
+
+
+def test_invalidate_drops_a_company_or_some_of_its_sections(workdir):
+    for section in ("news", "market", "financials"):
+        agent_cache.put(section, ACME, f"Acme {section}.")
+    agent_cache.put("news", {**ACME, "company_name": "Globex"}, "Globex news.")
+
+    assert agent_cache.invalidate("acme", ["news", "market"]) == 2
+    assert agent_cache.get("news", ACME) is None
+    assert agent_cache.get("financials", ACME)["content"] == "Acme financials."
+
+    assert agent_cache.invalidate("Acme") == 1
+    assert agent_cache.get("news", {**ACME, "company_name": "Globex"})["content"] == "Globex news."
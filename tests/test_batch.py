@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import batch
+import jobs
+from jobs import JobManager, RunningElsewhere, job_key, lock_name
+from state import MemoryState
+
+PARAMS = {"geo_focus": "Global", "industry_focus": "", "time_horizon": "last 12 months"}
+
+
+@pytest.fixture
+def shared(workdir, monkeypatch):
+    """One state backend for the batch and the chat's job manager, and research that fails for Initech."""
+    state = MemoryState()
+    monkeypatch.setattr(batch, "state", state)
+    researched = []
+
+    async def research(args, progress=None):
+        researched.append(args["company_name"])
+        await progress({"event": "agent_done", "section": "news", "outcome": "ok"})
+        if args["company_name"] == "Initech":
+            raise RuntimeError("no sources")
+        return f"researched {args['company_name']}"
+
+    monkeypatch.setattr(batch, "trigger_deep_research", research)
+    state.researched = researched
+    return state
+
+
+def test_a_rerun_resumes_the_unfinished_companies(shared):
+    record = batch.new_batch(["Acme", "Initech", "Acme "], PARAMS)
+    assert list(record["companies"]) == ["Acme", "Initech"]
+
+    record = asyncio.run(batch.run_batch(record))
+    assert record["status"] == "incomplete"
+    assert {c: e["status"] for c, e in record["companies"].items()} == {"Acme": "done", "Initech": "failed"}
+    assert batch.load(record["batch_id"])["companies"]["Initech"]["error"] == "RuntimeError: no sources"
+
+    resumed = batch.new_batch(["Initech", "Acme"], PARAMS)
+    assert resumed["batch_id"] == record["batch_id"]
+    assert {c: e["status"] for c, e in resumed["companies"].items()} == {"Acme": "done", "Initech": "pending"}
+    asyncio.run(batch.run_batch(resumed))
+    assert sorted(shared.researched) == ["Acme", "Initech", "Initech"]
+
+    # finished companies are run again once they are older than max_age_days
+    assert batch.new_batch(["Acme"], PARAMS, max_age_days=0)["companies"]["Acme"] == {"status": "pending"}
+
+
+def test_companies_with_a_recent_report_are_skipped(shared, monkeypatch):
+    monkeypatch.setattr(batch, "is_fresh", lambda company, max_age_days: company == "Acme")
+    record = asyncio.run(batch.run_batch(batch.new_batch(["Acme", "Globex"], PARAMS)))
+    assert {c: e["status"] for c, e in record["companies"].items()} == {"Acme": "fresh", "Globex": "done"}
+    assert shared.researched == ["Globex"]
+
+    asyncio.run(batch.run_batch(batch.new_batch(["Acme"], PARAMS, refresh=True)))
+    assert shared.researched == ["Globex", "Acme"]
+
+
+def test_batch_companies_are_followed_as_jobs(shared):
+    record = asyncio.run(batch.run_batch(batch.new_batch(["Acme"], PARAMS)))
+    job = shared.get_job(record["companies"]["Acme"]["job_id"])
+    assert job["job_id"].startswith(f"batch-{record['batch_id']}-")
+    assert (job["status"], job["result"], job["progress"]) == ("done", "researched Acme", {"news": "ok"})
+
+
+def test_chat_joins_the_company_a_batch_is_running(shared, monkeypatch):
+    manager = JobManager(runners={}, state=shared)
+    args = {"company_name": "Acme", **PARAMS, "refresh": False}
+
+    async def main():
+        started = asyncio.Event()
+
+        async def research(args, progress=None):
+            started.set()
+            await asyncio.sleep(0.05)
+            return "researched"
+
+        monkeypatch.setattr(batch, "trigger_deep_research", research)
+        running = asyncio.create_task(batch.run_batch(batch.new_batch(["Acme"], PARAMS)))
+        await started.wait()
+        joined = await manager.submit(args)
+        record = await running
+        return joined, record
+
+    (job, created), record = asyncio.run(main())
+    assert not created
+    assert job.id == record["companies"]["Acme"]["job_id"] and job.status == "running"
+
+
+def test_a_lock_without_a_job_record_is_reported(shared):
+    shared.acquire(lock_name(job_key({"company_name": "Acme"})), "batch-0123456789ab", jobs.JOB_LOCK_TTL)
+    with pytest.raises(RunningElsewhere, match="already running as batch-0123456789ab"):
+        asyncio.run(JobManager(runners={}, state=shared).submit({"company_name": "Acme"}))
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+
+import catalog
+
+
+def write_report(workdir, name, company, industry="None", age_days=0):
+    path = workdir / "reports" / name
+    path.write_text(
+        f"<div class='subtitle'><b>Company:</b> {company}<br><b>Industry:</b> {industry}<br></div>",
+        encoding="utf-8",
+    )
+    when = datetime(2024, 6, 1).timestamp() - age_days * 86400
+    os.utime(path, (when, when))
+    return path
+
+
+def test_reconcile_reads_the_subtitles(workdir):
+    write_report(workdir, "Acme.html", "Acme", "Retail")
+    write_report(workdir, "Acme.partial.html", "Acme")
+    catalog.reconcile("reports")
+
+    row = catalog.get_file("Acme.html")
+    assert row["company"] == "Acme" and row["industry"] == "Retail" and row["etag"]
+    assert catalog.get_file("Acme.partial.html") is None
+
+
+def test_get_report_falls_back_to_the_latest_of_a_company(workdir):
+    write_report(workdir, "Acme_old.html", "Acme", age_days=30)
+    write_report(workdir, "Acme_new.html", "Acme")
+    catalog.reconcile("reports")
+
+    assert catalog.get_report("Acme_old.html")["filename"] == "Acme_old.html"
+    assert catalog.get_report("acme")["filename"] == "Acme_new.html"
+    assert catalog.get_report("Initech") is None
+
+
+def test_query_reports_filters_and_pages(workdir):
+    write_report(workdir, "Acme.html", "Acme", "Retail", age_days=30)
+    write_report(workdir, "Globex.html", "Globex", "Energy", age_days=10)
+    write_report(workdir, "Initech.html", "Initech", "Software")
+    catalog.reconcile("reports")
+
+    rows, total = catalog.query_reports(limit=2)
+    assert total == 3 and [r["company"] for r in rows] == ["Initech", "Globex"]
+    assert [r["company"] for r in catalog.query_reports(industry="ENERGY")[0]] == ["Globex"]
+    assert [r["company"] for r in catalog.query_reports(since="2024-05-15")[0]] == ["Initech", "Globex"]
+    assert [r["company"] for r in catalog.query_reports(until="2024-05-15")[0]] == ["Acme"]
+
+
+def test_unreadable_dates_do_not_fail_the_query(workdir):
+    write_report(workdir, "Acme.html", "Acme")
+    catalog.reconcile("reports")
+
+    assert catalog.parse_date("last year") is None
+    assert catalog.query_reports(since="last year", until="2024-13-45")[1] == 1
+
+
+def test_removed_files_leave_the_catalog(workdir):
+    path = write_report(workdir, "Acme.html", "Acme")
+    catalog.reconcile("reports")
+    path.unlink()
+    catalog.reconcile("reports")
+    assert catalog.query_reports()[1] == 0
@@ -0,0 +1,50 @@
+from compress import compress_sections
+from textutils import estimate_tokens
+
+SECTIONS = {
+    "financials": "## Financials\n- Revenue grew 12% to $94.9 billion in fiscal 2024, driven by services.\n- Debt rose to $104 billion.",
+    "news": "## News\n- Revenue grew 12% to $94.9 billion in fiscal 2024, driven by services.\n- The EU fined the company €1.8 billion.",
+    "sentiment": "## Sentiment\n- Retail investors remain bullish on services growth.",
+    "market": "## Market\n- Competitors cut prices in Europe.",
+}
+
+
+def test_sentences_repeated_across_sections_are_kept_once():
+    compressed, stats = compress_sections(SECTIONS)
+    text = "\n".join(compressed.values())
+    assert text.count("Revenue grew 12%") == 1
+    assert stats["duplicates"] == 1
+    assert "EU fined" in compressed["news"]
+
+
+def test_look_alikes_with_different_figures_are_distinct_facts():
+    sections = {
+        "financials": "- Revenue grew 12% to $94.9 billion in fiscal 2024.",
+        "news": "- Revenue grew 15% to $97.1 billion in fiscal 2025.",
+    }
+    compressed, stats = compress_sections(sections)
+    assert stats["duplicates"] == 0
+    assert "12%" in compressed["financials"] and "15%" in compressed["news"]
+
+
+def test_output_fits_the_budget_and_keeps_every_section():
+    sections = {
+        name: "\n".join(f"- {name} point {i}: segment {i % 7} moved {i}% in region {i % 11}." for i in range(300))
+        for name in ("financials", "news", "sentiment", "market")
+    }
+    compressed, stats = compress_sections(sections, budget=800)
+    assert stats["tokens_out"] <= 800 + 4
+    assert all(compressed.values())
+
+
+def test_original_order_and_headings_are_kept():
+    sections = {"financials": "# Report\n## Growth\n- Sales rose 3%.\n- Costs fell 2%.\n## Empty\n"}
+    compressed, _ = compress_sections(sections)
+    assert compressed["financials"] == "# Report\n## Growth\n- Sales rose 3%.\n- Costs fell 2%."
+
+
+def test_text_under_budget_is_only_deduplicated():
+    compressed, stats = compress_sections(SECTIONS, budget=10_000)
+    assert stats["dropped"] == 0
+    assert compressed["market"] == SECTIONS["market"]
+    assert sum(estimate_tokens(t) for t in compressed.values()) < sum(estimate_tokens(t) for t in SECTIONS.values())
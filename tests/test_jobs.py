@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from jobs import JobManager, job_key
+from state import MemoryState
+
+
+@pytest.fixture
+def manager():
+    calls = []
+
+    async def run(args, progress=None):
+        calls.append(args)
+        await asyncio.sleep(0.05)
+        return f"researched {args['company_name']}"
+
+    manager = JobManager(runners={"research": run, "refresh": run}, state=MemoryState())
+    manager.calls = calls
+    return manager
+
+
+def test_identical_requests_share_one_job(manager):
+    async def main():
+        submitted = await asyncio.gather(*(manager.submit({"company_name": "Acme"}) for _ in range(5)))
+        await submitted[0][0].task
+        return submitted
+
+    submitted = asyncio.run(main())
+    assert len({job.id for job, _ in submitted}) == 1
+    assert [created for _, created in submitted] == [True, False, False, False, False]
+    assert len(manager.calls) == 1
+    assert submitted[0][0].status == "done"
+
+
+def test_defaults_and_case_do_not_split_jobs():
+    assert job_key({"company_name": "Acme"}) == job_key({"company_name": " acme ", "geo_focus": "Global"})
+    assert job_key({"company_name": "Acme"}) != job_key({"company_name": "Acme", "time_horizon": "last 5 years"})
+
+
+def test_refresh_is_not_folded_into_a_normal_run(manager):
+    async def main():
+        first, _ = await manager.submit({"company_name": "Acme"})
+        second, created = await manager.submit({"company_name": "Acme", "refresh": True})
+        await asyncio.gather(first.task, second.task)
+        return first, second, created
+
+    first, second, created = asyncio.run(main())
+    assert created and first.id != second.id
+    assert [bool(args.get("refresh")) for args in manager.calls] == [False, True]
+
+
+def test_a_new_job_starts_once_the_previous_one_finished(manager):
+    async def main():
+        first, _ = await manager.submit({"company_name": "Acme"})
+        await first.task
+        return first, await manager.submit({"company_name": "Acme"})
+
+    first, (second, created) = asyncio.run(main())
+    assert created and second.id != first.id
+
+
+def test_finished_jobs_are_found_by_id(manager):
+    async def main():
+        job, _ = await manager.submit({"company_name": "Acme"})
+        await job.task
+        return job, await manager.get(job.id), await manager.get("missing")
+
+    job, found, missing = asyncio.run(main())
+    assert found is job and found.result == "researched Acme"
+    assert missing is None
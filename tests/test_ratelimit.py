@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import Limiter
+
+
+def drained(rpm=600, tpm=None):
+    limiter = Limiter("test", rpm, tpm)
+    limiter.requests.level = 0
+    if limiter.tokens:
+        limiter.tokens.level = 0
+    return limiter
+
+
+def test_waiting_calls_are_served_by_priority(monkeypatch):
+    monkeypatch.setattr(ratelimit, "INTERACTIVE_RESERVE", 0)
+    limiter = drained()
+    order = []
+
+    async def call(priority):
+        await limiter.acquire(priority=priority)
+        order.append(priority)
+
+    async def main():
+        batch = asyncio.create_task(call("batch"))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(call("interactive"), batch)
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch"]
+
+
+def test_reserve_is_left_to_interactive_calls():
+    limiter = Limiter("test", 100)
+    limiter.requests.level = ratelimit.INTERACTIVE_RESERVE * 100 - 1
+
+    async def main():
+        await asyncio.wait_for(limiter.acquire(priority="interactive"), 0.5)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(priority="research"), 0.5)
+
+    asyncio.run(main())
+
+
+def test_429_pauses_background_calls_only():
+    limiter = Limiter("test", 6000)
+    limiter.throttled(retry_after=5)
+    assert limiter.scale == 0.5
+
+    async def main():
+        await asyncio.wait_for(limiter.acquire(priority="interactive"), 0.5)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(priority="batch"), 0.5)
+
+    asyncio.run(main())
+
+
+def test_settle_corrects_the_token_reservation():
+    limiter = Limiter("test", 100, 10_000)
+    limiter.acquire_sync(1000)
+    level = limiter.tokens.level
+    limiter.settle(1000, None)
+    assert limiter.tokens.level == level
+    limiter.settle(1000, 0)
+    assert limiter.tokens.level == pytest.approx(level + 1000)
+
+
+def test_priority_reaches_threads_started_inside():
+    async def main():
+        with ratelimit.priority("batch"):
+            return await asyncio.to_thread(ratelimit.current_priority.get)
+
+    assert asyncio.run(main()) == "batch"
+    assert ratelimit.current_priority.get() == "research"
@@ -0,0 +1,57 @@
+import pytest
+
+import catalog
+import router
+from router import route
+
+
+@pytest.fixture
+def reports(workdir):
+    for company in ("Tesla", "Nvidia"):
+        path = workdir / "reports" / f"{company}.html"
+        path.write_text(f"<html>{company}</html>")
+        catalog.record_report(str(path), company)
+    return workdir
+
+
+@pytest.mark.parametrize("text, symbol, timeframe", [
+    ("show TSLA chart", "NASDAQ:TSLA", "1D"),
+    ("nvidia price chart monthly", "NASDAQ:NVDA", "1M"),
+    ("chart NYSE:JPM yearly", "NYSE:JPM", "1Y"),
+])
+def test_chart_commands(workdir, text, symbol, timeframe):
+    found = route(text)
+    assert found.tool == "display_tradingview_chart"
+    assert found.args == {"symbol": symbol, "timeframe": timeframe}
+
+
+@pytest.mark.parametrize("text", [
+    "show TSLA chart and explain the risks",
+    "chart TSLA against NVDA",
+    "what does a price chart tell us",
+    "show AI chart",
+    "IT chart",
+])
+def test_anything_not_fully_recognised_goes_to_the_model(workdir, text):
+    assert route(text) is None
+
+
+def test_list_commands(reports):
+    assert route("list reports").args == {}
+    assert route("which reports do we have for Tesla").args == {"company": "Tesla"}
+    assert route("list reports about tesla margins") is None
+
+
+def test_open_commands(reports):
+    found = route("show me the Tesla report")
+    assert (found.tool, found.args, found.reply) == ("fetch_research", {"report_name": "Tesla.html"}, None)
+    assert route("open Nvidia.html").args == {"report_name": "Nvidia.html"}
+    assert route("open Apple.html") is None
+    assert route("show me the Intel report") is None
+
+
+def test_long_multiline_or_disabled_input_is_not_routed(workdir, monkeypatch):
+    assert route("show TSLA chart\nthen summarize the news") is None
+    assert route("show TSLA chart " + "please " * 20) is None
+    monkeypatch.setattr(router, "ROUTER_ENABLED", False)
+    assert route("show TSLA chart") is None
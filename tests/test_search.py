@@ -0,0 +1,49 @@
+import os
+
+import filingstore
+import search
+
+
+def write_report(workdir, company, text):
+    path = workdir / "reports" / f"{company}.html"
+    path.write_text(f"<section><h2>Financials</h2><p>{text}</p></section>", encoding="utf-8")
+    return path
+
+
+def test_index_ranks_reports_and_filings(workdir):
+    write_report(workdir, "Acme", "Acme revenue grew on strong cloud demand.")
+    write_report(workdir, "Globex", "Globex opened a new refinery in Texas.")
+    filingstore.put("Acme", "10-K", 2023, "0001", "https://example.com/acme", b"<p>Cloud revenue is our largest segment.</p>")
+    assert search.update_index() == 3
+
+    results = search.search("cloud revenue")
+    assert {r["kind"] for r in results} == {"report", "filing"}
+    assert all(r["company"] == "Acme" for r in results)
+    assert [r["company"] for r in search.search("refinery")] == ["Globex"]
+    assert search.search("the of") == []
+
+
+def test_filters_apply_while_scoring(workdir):
+    write_report(workdir, "Acme", "Acme revenue grew on strong cloud demand.")
+    filingstore.put("Acme", "10-K", 2023, "0001", "https://example.com/acme", b"<p>Cloud revenue is our largest segment.</p>")
+    write_report(workdir, "Globex", "Globex cloud revenue fell.")
+    search.update_index()
+
+    assert {r["kind"] for r in search.search("cloud", kind="filing")} == {"filing"}
+    assert {r["company"] for r in search.search("cloud", company="glob")} == {"Globex"}
+
+
+def test_only_changed_files_are_reindexed(workdir):
+    path = write_report(workdir, "Acme", "Acme revenue grew.")
+    search.update_index()
+    assert search.update_index() == 0
+
+    path.write_text("<section><h2>News</h2><p>Acme hired a new chief executive.</p></section>", encoding="utf-8")
+    os.utime(path, (os.stat(path).st_mtime + 1,) * 2)
+    assert search.update_index([os.path.join("reports", "Acme.html")]) == 1
+    assert search.search("revenue") == []
+    assert search.search("executive")[0]["section"] == "News"
+
+    os.remove(path)
+    assert search.update_index() == 1
+    assert search.search("executive") == []
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+# the OpenAI client is created at import, no request reaches it here
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import catalog
+import server
+from report import write_variants
+
+HTML = "<html><body>" + "Acme report. " * 200 + "</body></html>"
+
+
+@pytest.fixture
+def client(workdir):
+    path = os.path.join("reports", "Acme.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HTML)
+    write_variants(path, HTML.encode("utf-8"))
+    with open(path + ".br", "wb") as f:
+        f.write(b"brotli bytes")
+    catalog.record_report(path, "Acme")
+    # without a with block the startup work of the lifespan does not run
+    return TestClient(server.app)
+
+
+def etag():
+    return catalog.get_file("Acme.html")["etag"]
+
+
+def test_the_best_accepted_encoding_is_served(client):
+    response = client.get("/reports/Acme.html", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f'"{etag()}-gzip"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == HTML
+
+    response = client.get("/reports/Acme.html", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["etag"] == f'"{etag()}-br"'
+
+    response = client.get("/reports/Acme.html", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{etag()}"'
+    assert response.text == HTML
+
+
+def test_outdated_variants_are_not_served(client):
+    path = os.path.join("reports", "Acme.html")
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    response = client.get("/reports/Acme.html", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers and response.text == HTML
+
+
+def test_matching_etags_get_a_304(client):
+    for tag in (f'"{etag()}"', f'"{etag()}-gzip"', f'W/"{etag()}-br"', f'"stale", "{etag()}"', "*"):
+        response = client.get("/reports/Acme.html", headers={"If-None-Match": tag, "Accept-Encoding": "gzip"})
+        assert response.status_code == 304 and response.content == b""
+        assert response.headers["cache-control"] == "no-cache"
+
+    response = client.get("/reports/Acme.html", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_unknown_reports_are_404(client):
+    assert client.get("/reports/Initech.html").status_code == 404
+    assert client.get("/reports/..%2Fserver.py").status_code == 404
@@ -0,0 +1,94 @@
+import time, asyncio
+
+from sessions import Session, SessionStore, SUMMARY_PREFIX, COMPACT_RESULT_CHARS, split_turns
+
+
+def turn(n, size=400):
+    return [{"role": "user", "content": f"question {n} " + "x" * size}, {"role": "assistant", "content": "y" * size}]
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert store.peek("b") is None
+    assert store.peek("a") and store.peek("c")
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(idle_ttl=60)
+    store.get("old").last_used = time.time() - 120
+    store.get("new")
+    assert store.peek("old") is None
+    assert len(store) == 1
+
+
+def test_tool_results_stay_in_the_turn_of_their_call():
+    messages = [
+        {"role": "user", "content": "q1"},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "1", "function": {"name": "t", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": "1", "content": "result"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "q2"},
+    ]
+    assert [len(t) for t in split_turns(messages)] == [4, 1]
+
+
+def test_compact_summarizes_old_turns_and_keeps_the_newest():
+    store = SessionStore()
+    session = store.get("s")
+    for n in range(6):
+        session.messages += turn(n)
+
+    async def summarize(previous, old):
+        return f"{len(old)} messages"
+
+    assert asyncio.run(store.compact(session, summarize, budget=600))
+    assert session.messages[0]["content"] == SUMMARY_PREFIX + "10 messages"
+    assert session.messages[-2]["content"].startswith("question 5")
+    assert session.tokens() <= 600
+
+
+def test_compact_keeps_turns_added_during_the_summary():
+    store = SessionStore()
+    session = store.get("s")
+    for n in range(6):
+        session.messages += turn(n)
+
+    async def summarize(previous, old):
+        session.messages.append({"role": "user", "content": "while summarizing"})
+        return "summary"
+
+    assert asyncio.run(store.compact(session, summarize, budget=600))
+    assert session.messages[-1]["content"] == "while summarizing"
+    assert sum(m["content"] == "while summarizing" for m in session.messages) == 1
+
+
+def test_compact_does_not_revive_a_cleared_session():
+    store = SessionStore()
+    session = store.get("s")
+    for n in range(6):
+        session.messages += turn(n)
+
+    async def summarize(previous, old):
+        store.clear("s")
+        return "summary"
+
+    assert not asyncio.run(store.compact(session, summarize, budget=600))
+    assert store.peek("s") is None
+
+
+def test_bulky_tool_results_become_recallable_handles():
+    session = Session("s")
+    full = "z" * (COMPACT_RESULT_CHARS + 1)
+    session.messages = [
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "1", "function": {"name": "fetch_research", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": "1", "content": full},
+    ]
+    assert session.compact_tool_results() == 1
+    digest = session.messages[1]["content"]
+    assert digest.startswith("[fetch_research result") and len(digest) < len(full)
+    handle = digest.split("stored as ")[1].split(".")[0]
+    assert session.recall(handle) == full
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from state import MemoryState, SqliteState
+
+
+@pytest.fixture(params=[MemoryState, SqliteState])
+def state(request, workdir):
+    return request.param()
+
+
+def test_a_lock_has_one_owner_until_it_expires(state):
+    assert state.acquire("job:acme", "a", ttl=60) is None
+    assert state.acquire("job:acme", "b", ttl=60) == "a"
+    assert state.acquire("job:acme", "a", ttl=60) is None
+
+    state.release("job:acme", "b")
+    assert state.acquire("job:acme", "b", ttl=60) == "a"
+    state.release("job:acme", "a")
+    assert state.acquire("job:acme", "b", ttl=-1) is None
+    # an expired lock is free for anyone
+    assert state.acquire("job:acme", "a", ttl=60) is None
+
+
+def test_job_records_are_kept_by_id(state):
+    state.put_job({"job_id": "1", "status": "running"})
+    state.put_job({"job_id": "2", "status": "running"})
+    state.put_job({"job_id": "1", "status": "done"})
+    assert state.get_job("1") == {"job_id": "1", "status": "done"}
+    assert state.get_job("3") is None
+    assert {job["job_id"] for job in state.list_jobs()} == {"1", "2"}
+
+
+def test_sqlite_sessions_are_shared_between_stores(workdir):
+    first, second = SqliteState().sessions, SqliteState().sessions
+    session = first.get("s")
+    session.messages.append({"role": "user", "content": "hello"})
+    first.save(session)
+    assert second.peek("s").messages == [{"role": "user", "content": "hello"}]
+    assert second.clear("s") and first.peek("s") is None
+
+
+def test_replace_prefix_keeps_turns_saved_meanwhile(workdir):
+    store = SqliteState().sessions
+    session = store.get("s")
+    session.messages = [{"role": "user", "content": str(n)} for n in range(4)]
+    store.save(session)
+    prefix = session.messages[:3]
+
+    # another worker appends a turn while the summary is written
+    other = store.peek("s")
+    other.messages.append({"role": "user", "content": "4"})
+    store.save(other)
+
+    head = [{"role": "system", "content": "summary"}]
+    assert asyncio.run(store.replace_prefix(session, prefix, head))
+    assert [m["content"] for m in store.peek("s").messages] == ["summary", "3", "4"]
+    assert session.messages == store.peek("s").messages
+
+
+def test_replace_prefix_does_not_revive_a_cleared_session(workdir):
+    store = SqliteState().sessions
+    session = store.get("s")
+    session.messages = [{"role": "user", "content": "old"}]
+    store.save(session)
+    store.clear("s")
+
+    assert not asyncio.run(store.replace_prefix(session, session.messages[:1], []))
+    assert store.peek("s") is None
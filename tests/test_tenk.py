@@ -0,0 +1,37 @@
+import filingstore
+import tenk
+
+TOC = "<p>Table of Contents</p><p>Item 1. Business 3</p><p>Item 1A. Risk Factors 9</p><p>Item 7. Management's Discussion 30</p>"
+
+
+def filing(risks):
+    body = (
+        "<p>Item 1. Business</p><p>Acme makes anvils for cartoon coyotes.</p>"
+        f"<p>ITEM 1A: Risk Factors</p><p>{risks}</p>"
+        "<p>Item 7 - Management's Discussion and Analysis</p><p>Revenue grew on anvil demand.</p>"
+        "<p>Item 15. Exhibits</p><p>Exhibit list.</p>"
+    )
+    return (TOC + body).encode("utf-8")
+
+
+def test_items_come_from_the_body_not_the_table_of_contents(workdir):
+    sha = filingstore.put("Acme", "10-K", "2023", "0001", "https://example.com/2023", filing("Roadrunners."))
+    assert [item for item, _, _ in tenk.extract_sections(sha)] == ["1", "1A", "7", "15"]
+
+    tenk.index_all()
+    sections = tenk.get_sections("acme", ("1A", "7"), years=1)
+    assert [s["item"] for s in sections] == ["1A", "7"]
+    assert "Roadrunners." in sections[0]["text"] and "Item 7" not in sections[0]["text"]
+    assert "anvil demand" in sections[1]["text"] and "Exhibit" not in sections[1]["text"]
+
+
+def test_latest_years_first_and_cut_to_max_chars(workdir):
+    filingstore.put("Acme", "10-K", "2022", "0001", "https://example.com/2022", filing("Old risks."))
+    filingstore.put("Acme", "10-K", "2023", "0002", "https://example.com/2023", filing("New risks."))
+    assert tenk.index_all() == 2
+    assert tenk.index_all() == 0
+
+    sections = tenk.get_sections("Acme", ("1A",), years=2, max_chars=12)
+    assert [(s["year"], s["text"]) for s in sections] == [("2023", "ITEM 1A: Ris"), ("2022", "ITEM 1A: Ris")]
+    assert tenk.filing_context("Acme", items=("1A",), years=1).startswith("Source: Acme Form 10-K 2023, Item 1A.")
+    assert tenk.filing_context("Initech") == ""
@@ -0,0 +1,30 @@
+import catalog
+import tools
+from textutils import estimate_tokens
+
+
+def write_report(workdir, company="Acme"):
+    paragraph = "Revenue grew strongly on cloud demand while margins held steady across regions. "
+    sections = "".join(
+        f"<section><h2>{title}</h2><p>{paragraph * 60}</p></section>"
+        for title in ("Financials", "News", "Sentiment", "Market")
+    )
+    path = workdir / "reports" / f"{company}.html"
+    path.write_text(f"<div><b>Company:</b> {company}<br></div>{sections}", encoding="utf-8")
+    catalog.record_report(str(path), company)
+
+
+def test_fetch_research_stays_within_max_tokens(workdir):
+    write_report(workdir)
+    for budget in (300, 1000, 3000):
+        condensed = tools.fetch_research({"report_name": "Acme", "max_tokens": budget})
+        passages = tools.fetch_research({"report_name": "Acme", "max_tokens": budget, "question": "cloud revenue"})
+        assert "## Financials" in condensed and "passages relevant" in passages
+        assert estimate_tokens(condensed) <= budget
+        assert estimate_tokens(passages) <= budget
+
+
+def test_fetch_research_reports_missing_sections(workdir):
+    write_report(workdir)
+    assert tools.fetch_research({"report_name": "Initech"}) == "Report 'Initech' not found."
+    assert "Available: Financials" in tools.fetch_research({"report_name": "Acme", "sections": ["esg"]})
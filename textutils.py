@@ -0,0 +1,118 @@
+import re, math
+from html.parser import HTMLParser
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9&'\-]*")
+
+STOPWORDS = set("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his how i if
+in into is it its itself just me more most my no nor not now of off on once only or other our ours out over own same she
+should so some such than that the their theirs them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+def estimate_tokens(text):
+    """Cheap token estimate, about four characters per token for English prose."""
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords, shared by ranking and search."""
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def split_passages(text, max_chars=1200):
+    """Split text on blank lines, packing short paragraphs together up to max_chars."""
+    passages, current = [], ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if current and len(current) + len(para) + 2 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+        while len(current) > max_chars:
+            cut = current.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            passages.append(current[:cut])
+            current = current[cut:].lstrip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class TextExtractor(HTMLParser):
+    """Readable text of an HTML document, one paragraph per block element."""
+
+    # ix:header holds the hidden XBRL facts of SEC inline filings
+    SKIP = {"style", "script", "head", "title", "ix:header"}
+    BLOCK = {"p", "div", "br", "tr", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6", "section", "pre", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(self._skip - 1, 0)
+        elif tag in self.BLOCK:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def text(self):
+        text = re.sub(r"[ \t\r\f\v\xa0]+", " ", "".join(self.parts))
+        text = re.sub(r" *\n *", "\n", text)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def html_to_text(html):
+    parser = TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def truncate_tokens(text, budget):
+    """Trim text to roughly budget tokens, on a word boundary."""
+    if estimate_tokens(text) <= budget:
+        return text
+    cut = text.rfind(" ", 0, budget * 4)
+    return text[:cut if cut > 0 else budget * 4].rstrip() + " …"
+
+
+def bm25_scores(query, docs, k1=1.5, b=0.75):
+    """BM25 score of each tokenized doc against the query tokens, for small in-memory collections."""
+    n = len(docs)
+    if not n:
+        return []
+    avgdl = sum(len(d) for d in docs) / n or 1
+    terms = set(query)
+    vocab = [set(d) for d in docs]
+    df = {t: sum(1 for v in vocab if t in v) for t in terms}
+
+    scores = []
+    for doc in docs:
+        tf = {}
+        for w in doc:
+            if w in terms:
+                tf[w] = tf.get(w, 0) + 1
+        score = 0.0
+        for t, f in tf.items():
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
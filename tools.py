@@ -1,53 +1,250 @@
 from dotenv import load_dotenv
-import os, json, asyncio, traceback
+import os, json, time, asyncio, traceback
+from datetime import datetime
 
-from agents import CompanyResearcher
-from report import save_html
+import catalog, search, artifacts, metrics, agent_cache
+from agents import CompanyResearcher, RESEARCH_AGENTS
+from report import save_html, save_partial, parse_report
+from textutils import tokenize, estimate_tokens, split_passages, truncate_tokens, bm25_scores
 
 load_dotenv()
 
 REPORT_DIR = "reports"
 os.makedirs(REPORT_DIR, exist_ok=True)
 
-def list_existing_researches():
-    reports = [f for f in os.listdir(REPORT_DIR) if f.endswith(".html")]
-    if not reports:
-        return "No reports found."
-    report_list = "\n- ".join(reports)
-    return f"I found {len(reports)} report(s):\n- {report_list}\n\nWould you like me to open it, summarize it, or run a new company research? \n Note: Pass this info and links as it is to user!"
+# instruction for the model at the end of a report listing, not meant for the user
+LLM_NOTE = " \n Note: Pass this info and links as it is to user!"
+
+# default size of a fetch_research result in tokens
+FETCH_TOKEN_BUDGET = 3000
+
+def describe_report(row):
+    generated = datetime.fromtimestamp(row["generated_at"]).strftime("%Y-%m-%d")
+    details = [row["company"], row["industry"] or "any industry", row["geo"] or "Global", f"generated {generated}", f"{row['size'] // 1024} KB"]
+    return f"{row['filename']} ({' | '.join(details)})"
+
+def list_existing_researches(args=None):
+    args = args or {}
+    limit = min(int(args.get("limit") or 20), 100)
+    offset = int(args.get("offset") or 0)
+    for field in ("since", "until"):
+        if args.get(field) and catalog.parse_date(args[field]) is None:
+            return f"Could not read {field}={args[field]!r}, dates must be YYYY-MM-DD." + LLM_NOTE
+    rows, total = catalog.query_reports(
+        company=args.get("company"),
+        industry=args.get("industry"),
+        since=args.get("since"),
+        until=args.get("until"),
+        limit=limit,
+        offset=offset,
+    )
+    if not rows:
+        return "No reports found." if not total else f"No more reports, all {total} already listed."
+
+    report_list = "\n- ".join(describe_report(row) for row in rows)
+    result = f"I found {total} report(s), showing {offset + 1}-{offset + len(rows)}:\n- {report_list}"
+    if offset + len(rows) < total:
+        result += f"\n\nMore reports available, use offset={offset + len(rows)} for the next page."
+    return result + "\n\nWould you like me to open it, summarize it, or run a new company research?" + LLM_NOTE
+
+def relevant_passages(sections, question, budget):
+    """Best matching passages for the question, kept in report order under their headings."""
+    passages = [(title, i, p) for title, text in sections.items() for i, p in enumerate(split_passages(text))]
+    scores = bm25_scores(tokenize(question), [tokenize(f"{title} {p}") for title, _, p in passages])
+
+    picked, used = [], 0
+    for score, n in sorted(((s, n) for n, s in enumerate(scores) if s > 0), reverse=True):
+        cost = estimate_tokens(passages[n][2])
+        if used + cost > budget:
+            continue
+        picked.append(n)
+        used += cost
+
+    grouped = {}
+    for n in sorted(picked):
+        title, _, passage = passages[n]
+        grouped.setdefault(title, []).append(passage)
+    return grouped
+
+def condensed_sections(sections, budget):
+    """Every section, each cut to an equal share of the budget."""
+    share = budget // max(len(sections), 1)
+    return {title: [truncate_tokens(text, share)] for title, text in sections.items()}
 
 def fetch_research(args):
-    """Return the HTML content of a requested report."""
+    """Return the relevant plain-text sections of a report, or its HTML when asked."""
     report_name = args.get("report_name")
     if not report_name:
         return "Please provide a report_name."
     
-    filepath = os.path.join(REPORT_DIR, report_name)
-    if not os.path.exists(filepath):
+    report = catalog.get_report(report_name)
+    if not report:
         return f"Report '{report_name}' not found."
-    
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    return content
 
-async def trigger_deep_research(args):
+    filepath = os.path.join(REPORT_DIR, report["filename"])
+
+    if args.get("format") == "html":
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+
+    sections = parse_report(filepath)
+    wanted = [w.lower() for w in args.get("sections") or []]
+    if wanted:
+        sections = {t: x for t, x in sections.items() if any(w in t.lower() for w in wanted)}
+        if not sections:
+            return f"No matching sections in {report['filename']}. Available: {', '.join(parse_report(filepath))}."
+
+    question = args.get("question")
+    header = (
+        f"Report {report['filename']} ({report['company']}, {report['industry'] or 'any industry'}, "
+        f"{report['geo'] or 'Global'}, {report['time_horizon'] or 'n/a'}).\n"
+        f"Sections: {'; '.join(parse_report(filepath))}.\n"
+        "Showing {view}, ask with a question or sections for more detail."
+    )
+    # the header and section headings count against max_tokens too
+    overhead = estimate_tokens(header.replace("{view}", "passages relevant to the question"))
+    overhead += sum(estimate_tokens(f"## {title}") for title in sections)
+    budget = max(int(args.get("max_tokens") or FETCH_TOKEN_BUDGET) - overhead, 0)
+
+    chosen = relevant_passages(sections, question, budget) if question else {}
+    if not chosen:
+        chosen = condensed_sections(sections, budget)
+
+    header = header.replace("{view}", "passages relevant to the question" if question and chosen else "a condensed view")
+    body = "\n\n".join(f"## {title}\n" + "\n\n[…]\n\n".join(parts) for title, parts in chosen.items())
+    return f"{header}\n\n{body}"
+
+def search_documents(args):
+    """Ranked snippets from saved reports and downloaded 10-K filings."""
+    query = args.get("query")
+    if not query:
+        return "Please provide a query."
+
+    scope = args.get("scope", "all")
+    results = search.search(
+        query,
+        kind=None if scope == "all" else scope.rstrip("s"),
+        company=args.get("company"),
+        limit=min(int(args.get("limit") or 8), 30),
+    )
+    if not results:
+        return f"No matches for '{query}'."
+
+    lines = [f"Top {len(results)} match(es) for '{query}':"]
+    for n, r in enumerate(results, 1):
+        where = f"{r['title']} › {r['section']}" if r["section"] else r["title"]
+        lines.append(f"{n}. [{where}] ({r['path']}) {r['snippet']}")
+    return "\n".join(lines)
+
+def recall_result(text, args):
+    """A tool result compacted out of the conversation, narrowed to a question when one is given."""
+    if text is None:
+        return f"No stored result '{args.get('handle')}', it has expired. Call the original tool again."
+
+    question = args.get("question")
+    chosen = relevant_passages({"": text}, question, FETCH_TOKEN_BUDGET) if question else {}
+    if chosen:
+        return "\n\n[…]\n\n".join(chosen[""])
+    return text
+
+def research_params(args):
+    """Research inputs with defaults applied, used for running and deduplicating jobs."""
+    return {
+        "company_name": args["company_name"].strip(),
+        "geo_focus": args.get("geo_focus") or "Global",
+        "time_horizon": args.get("time_horizon") or "last 12 months",
+        "industry_focus": args.get("industry_focus"),
+    }
+
+def track_progress(research, progress=None):
+    """Save a partial report as each section finishes and pass the research's events on to progress.
+    A run that dies keeps the sections it completed."""
+    filename = f"{REPORT_DIR}/{research.company_name}.html"
+    # one writer at a time, so the last write has every finished section
+    lock = asyncio.Lock()
+
+    async def on_progress(event):
+        if event["event"] == "agent_done" and event["section"] != "synthesis":
+            async with lock:
+                path = await asyncio.to_thread(save_partial, research, filename)
+            event["partial_report"] = f"/reports/{os.path.basename(path)}"
+        if progress:
+            await progress(event)
+
+    research.on_progress = on_progress
+
+async def trigger_deep_research(args, progress=None):
+    params = research_params(args)
     research = CompanyResearcher()
-    research.company_name = args["company_name"]
-    research.geo_focus = args.get("geo_focus", "Global")
-    research.time_horizon = args.get("time_horizon", "last 12 months")
-    research.industry_focus = args.get("industry_focus")
+    research.company_name = params["company_name"]
+    research.geo_focus = params["geo_focus"]
+    research.time_horizon = params["time_horizon"]
+    research.industry_focus = params["industry_focus"]
+    research.use_cache = not args.get("refresh")
+    track_progress(research, progress)
     
-    await research.financial_research()
-    await research.news_intelligence()
-    await research.sentiment_analysis()
-    await research.market_context()
-    await research.insight_synthesis()
+    await research.run_research_agents(concurrent=not args.get("sequential"))
+    await research.run_synthesis()
     
+    return await publish_research(research, f"Research completed for {research.company_name}.")
+
+async def publish_research(research, summary, parent=None, refreshed=None):
+    """Render the report, store the run's artifact and index the report. Returns the tool result."""
     filename = f"{REPORT_DIR}/{research.company_name}.html"
-    save_html(research, filename)
+    started = time.perf_counter()
+    # brotli and gzip of a large report take long enough to stall every other request
+    await asyncio.to_thread(save_html, research, filename)
+    artifact = await asyncio.to_thread(artifacts.save, research, filename, parent, refreshed)
+    await asyncio.to_thread(search.update_index, [filename])
+    research.timings["publish"] = {"seconds": round(time.perf_counter() - started, 3), "outcome": "ok", "cost_usd": 0}
     
-    return f"Research completed for {research.company_name}. Report saved as {filename}."
+    kind = "refresh" if parent else "research"
+    finished_at = time.time()
+    metrics.observe("mars_research_seconds", finished_at - research.started_at, kind=kind)
+    await asyncio.to_thread(metrics.save_trace, kind, artifact["run_id"], {
+        "run_id": artifact["run_id"],
+        "kind": kind,
+        "params": artifact["params"],
+        "started_at": research.started_at,
+        "finished_at": finished_at,
+        "seconds": round(finished_at - research.started_at, 3),
+        "cost_usd": sum(step["cost_usd"] for step in research.timings.values()),
+        "steps": research.timings,
+        "gaps": research.gaps,
+    })
+    
+    result = f"{summary} Report saved as {filename} (run {artifact['run_id']})."
+    if research.cached:
+        result += f" Reused recent results for: {', '.join(research.cached)}."
+    if research.gaps:
+        result += f" Missing sections (marked in the report): {', '.join(research.gaps)}."
+    return result
+
+async def refresh_research(args, progress=None):
+    """Regenerate some sections of the latest stored run plus synthesis, keeping the others as they are."""
+    company = args["company_name"].strip()
+    sections = [s for s in args.get("sections") or [] if s in RESEARCH_AGENTS]
+    artifact = await asyncio.to_thread(artifacts.load, company)
+    if artifact is None:
+        # nothing stored to refresh from, e.g. reports made before artifacts existed
+        return await trigger_deep_research(args, progress)
+    
+    research = artifacts.to_researcher(artifact)
+    for name in ("geo_focus", "time_horizon", "industry_focus"):
+        if args.get(name):
+            setattr(research, name, args[name])
+    # the named sections were asked to be current, never serve them from the cache,
+    # and drop what is cached of them for other parameters too
+    research.use_cache = False
+    if sections:
+        await asyncio.to_thread(agent_cache.invalidate, company, sections)
+    track_progress(research, progress)
+    
+    await research.run_research_agents(sections=sections)
+    await research.run_synthesis()
+    
+    summary = f"Refreshed {', '.join(sections + ['synthesis'])} for {research.company_name}."
+    return await publish_research(research, summary, parent=artifact["run_id"], refreshed=sections)
 
 def display_tradingview_chart(args):
     """Generate TradingView chart HTML for display in chat."""
@@ -111,10 +308,35 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "list_existing_researches",
-            "description": "List all previously generated company research reports. You should forward this to the user as it is.",
+            "description": "List previously generated company research reports with their company, industry, geography and generation date, newest first. You should forward this to the user as it is.",
             "parameters": {
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "company": {
+                        "type": "string",
+                        "description": "Only reports whose company name contains this text"
+                    },
+                    "industry": {
+                        "type": "string",
+                        "description": "Only reports whose industry contains this text"
+                    },
+                    "since": {
+                        "type": "string",
+                        "description": "Only reports generated on or after this date (YYYY-MM-DD)"
+                    },
+                    "until": {
+                        "type": "string",
+                        "description": "Only reports generated before this date (YYYY-MM-DD)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Page size, default 20"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Number of reports to skip, for paging"
+                    }
+                },
                 "required": []
             }
         }
@@ -123,7 +345,7 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "trigger_deep_research",
-            "description": "Run a full multi-agent deep research on a company",
+            "description": "Start a full multi-agent deep research on a company as a background job. It takes several minutes, so tell the user the job id and that they can ask for its status.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -142,29 +364,145 @@ TOOLS = [
                     "time_horizon": {
                         "type": "string",
                         "description": "Time period for analysis (e.g., last 12 months, 3-5 years)"
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Rerun every agent instead of reusing recent results (financials are reused for 2 weeks, market context for 3 days, news and sentiment for 6 hours). Only when the user asks for fresh data."
                     }
                 },
                 "required": ["company_name"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "refresh_research",
+            "description": "Update an existing research report by regenerating only some of its sections (then the synthesis) as a background job, e.g. the news after a major event. Much faster than a full deep research. Tell the user the job id.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "company_name": {
+                        "type": "string",
+                        "description": "Name of the company whose report to update"
+                    },
+                    "sections": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(RESEARCH_AGENTS)},
+                        "description": "Sections to regenerate"
+                    },
+                    "time_horizon": {
+                        "type": "string",
+                        "description": "New time period for the regenerated sections, keeps the stored one if omitted"
+                    }
+                },
+                "required": ["company_name", "sections"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_research_status",
+            "description": "Check the status of a deep research job started with trigger_deep_research",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "The job id returned when the research was started"
+                    }
+                },
+                "required": ["job_id"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
             "name": "fetch_research",
-            "description": "Fetch the HTML content of a saved research report for summarization or Q&A",
+            "description": "Fetch a saved research report for summarization or Q&A. Returns plain-text sections; pass the user's question to get only the relevant passages.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "report_name": {
                         "type": "string",
-                        "description": "The name of the report to fetch, e.g., Tesla.html"
+                        "description": "The name of the report to fetch, e.g., Tesla.html, or a company name"
+                    },
+                    "question": {
+                        "type": "string",
+                        "description": "The user's question, used to select the relevant passages"
+                    },
+                    "sections": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Only these sections, matched by name: financials, news, sentiment, market, synthesis"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate size limit of the result, default 3000"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["text", "html"],
+                        "description": "html returns the full report markup, only use it when explicitly needed"
                     }
                 },
                 "required": ["report_name"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "recall_result",
+            "description": "Read again a tool result from an earlier turn that was replaced by a digest and a handle (res-...) in the conversation",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {
+                        "type": "string",
+                        "description": "Handle from the digest, e.g. res-1a2b3c4d5e"
+                    },
+                    "question": {
+                        "type": "string",
+                        "description": "Optional question, returns only the passages of the result that answer it"
+                    }
+                },
+                "required": ["handle"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_documents",
+            "description": "Full-text search across all saved research reports and downloaded 10-K filings. Use it for questions spanning several companies, e.g. which companies mention supply-chain risk. Returns ranked snippets with their source.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Keywords to search for"
+                    },
+                    "scope": {
+                        "type": "string",
+                        "enum": ["all", "reports", "filings"],
+                        "description": "Search research reports, 10-K filings or both (default)"
+                    },
+                    "company": {
+                        "type": "string",
+                        "description": "Only results for this company"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of snippets, default 8"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
     {
     "type": "function",
     "function": {
@@ -0,0 +1,226 @@
+import os, hashlib, threading
+from contextlib import contextmanager
+
+import numpy as np
+from openai import OpenAI, DefaultHttpxClient
+
+import tenk
+import metrics
+import ratelimit
+import filingstore
+from catalog import DATA_DIR, open_db
+from textutils import estimate_tokens
+
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIM = 1536
+EMBED_BATCH = 256
+
+# row i of the matrix file is the embedding stored under row i in vectors.db
+VECTOR_DIR = os.path.join(DATA_DIR, "vectors")
+VECTOR_DB = os.path.join(VECTOR_DIR, "vectors.db")
+MATRIX_FILE = os.path.join(VECTOR_DIR, f"{EMBED_MODEL}.f32")
+
+# chunk size for filing Items, in characters of extracted text
+CHUNK_CHARS = 1500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    hash TEXT PRIMARY KEY,
+    row  INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    sha256 TEXT NOT NULL,
+    item   TEXT NOT NULL,
+    start  INTEGER NOT NULL,
+    end    INTEGER NOT NULL,
+    hash   TEXT NOT NULL,
+    PRIMARY KEY (sha256, start)
+);
+CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash);
+"""
+
+_client = None
+_lock = threading.Lock()
+
+
+def client():
+    global _client
+    if _client is None:
+        _client = OpenAI(http_client=DefaultHttpxClient(
+            event_hooks={"response": [ratelimit.response_hook("openai_embeddings")]}
+        ))
+    return _client
+
+
+@contextmanager
+def db():
+    conn = open_db(VECTOR_DB, SCHEMA, timeout=60)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def content_hash(text):
+    return hashlib.sha256(f"{EMBED_MODEL}\0{text}".encode("utf-8")).hexdigest()
+
+
+def matrix():
+    """All cached embeddings as a read-only memory-mapped (rows, dim) float32 array."""
+    size = os.path.getsize(MATRIX_FILE) if os.path.exists(MATRIX_FILE) else 0
+    rows = size // (EMBED_DIM * 4)
+    if not rows:
+        return np.zeros((0, EMBED_DIM), dtype=np.float32)
+    return np.memmap(MATRIX_FILE, dtype=np.float32, mode="r", shape=(rows, EMBED_DIM))
+
+
+def embed(texts):
+    """Row numbers of the embeddings of texts, calling the API only for content never embedded before."""
+    hashes = [content_hash(t) for t in texts]
+    with db() as conn:
+        known = dict(conn.execute(
+            f"SELECT hash, row FROM embeddings WHERE hash IN ({','.join('?' * len(hashes))})", hashes
+        ).fetchall()) if hashes else {}
+
+    missing = list(dict.fromkeys(h for h in hashes if h not in known))
+    text_of = dict(zip(hashes, texts))
+    for i in range(0, len(missing), EMBED_BATCH):
+        batch = missing[i:i + EMBED_BATCH]
+        limiter = ratelimit.limiters["openai_embeddings"]
+        tokens = sum(estimate_tokens(text_of[h]) for h in batch)
+        limiter.acquire_sync(tokens)
+        used = 0
+        try:
+            with metrics.timer("mars_openai_seconds", model=EMBED_MODEL, stream="false"):
+                response = client().embeddings.create(model=EMBED_MODEL, input=[text_of[h] for h in batch])
+            used = getattr(getattr(response, "usage", None), "total_tokens", None)
+        finally:
+            limiter.settle(tokens, used)
+        metrics.record_usage(EMBED_MODEL, getattr(response, "usage", None), kind="embedding")
+        vectors = np.array([d.embedding for d in response.data], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+        # appends are serialised by the write transaction, so row numbers match file offsets across processes
+        with _lock, db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            start = (os.path.getsize(MATRIX_FILE) if os.path.exists(MATRIX_FILE) else 0) // (EMBED_DIM * 4)
+            with open(MATRIX_FILE, "ab") as f:
+                f.write(vectors.tobytes())
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?)",
+                ((h, start + n) for n, h in enumerate(batch)),
+            )
+            known.update(conn.execute(
+                f"SELECT hash, row FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+
+    return [known[h] for h in hashes]
+
+
+def _chunk(text, start):
+    """(start, end, text) byte ranges of roughly CHUNK_CHARS, split on paragraph boundaries."""
+    chunks, offset, current = [], start, ""
+    for para in text.split("\n\n"):
+        piece = para + "\n\n"
+        if current and len(current) + len(piece) > CHUNK_CHARS:
+            size = len(current.encode("utf-8"))
+            chunks.append((offset, offset + size, current))
+            offset += size
+            current = ""
+        current += piece
+    if current.strip():
+        chunks.append((offset, offset + len(current.encode("utf-8")), current))
+    return chunks
+
+
+def index_company(company, items=tenk.ITEMS, years=3):
+    """Chunk and embed a company's latest 10-K Items. Only chunks with new content cost embeddings."""
+    with db() as conn:
+        done = {row[0] for row in conn.execute("SELECT DISTINCT sha256 FROM chunks")}
+
+    new = []
+    for filing, section in tenk.section_rows(company, tuple(items), years):
+        if filing["sha256"] in done:
+            continue
+        text = filingstore.read_text(filing["sha256"], section["start"], section["end"])
+        for start, end, chunk in _chunk(text, section["start"]):
+            if chunk.strip():
+                new.append((filing["sha256"], section["item"], start, end, chunk))
+
+    if not new:
+        return 0
+    embed([c[4] for c in new])
+    with db() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+            ((sha, item, start, end, content_hash(chunk)) for sha, item, start, end, chunk in new),
+        )
+    return len(new)
+
+
+def search(company, queries, k=8, items=None, years=3):
+    """Top k chunks per query among a company's indexed 10-K Items.
+
+    All queries are scored in one matrix product against the memory-mapped
+    embeddings. Returns one list per query of dicts with year, item, score and text.
+    """
+    index_company(company, years=years)
+    rows = tenk.section_rows(company, tuple(items or tenk.ITEMS), years)
+    years_of = {filing["sha256"]: filing["year"] for filing, _ in rows}
+    wanted_items = {section["item"] for _, section in rows}
+    if not years_of:
+        return [[] for _ in queries]
+
+    with db() as conn:
+        chunks = [
+            dict(row) for row in conn.execute(
+                f"SELECT c.sha256, c.item, c.start, c.end, e.row FROM chunks c JOIN embeddings e ON e.hash = c.hash "
+                f"WHERE c.sha256 IN ({','.join('?' * len(years_of))})",
+                list(years_of),
+            )
+            if row["item"] in wanted_items
+        ]
+    if not chunks:
+        return [[] for _ in queries]
+
+    query_rows = embed(list(queries))
+    embeddings = matrix()
+    candidates = np.asarray(embeddings[np.array([c["row"] for c in chunks])])
+    scores = np.asarray(embeddings[np.array(query_rows)]) @ candidates.T
+
+    top = min(k, len(chunks))
+    results = []
+    for q_scores in scores:
+        best = np.argpartition(-q_scores, top - 1)[:top]
+        best = best[np.argsort(-q_scores[best])]
+        results.append([
+            {
+                "year": years_of[chunks[i]["sha256"]],
+                "item": chunks[i]["item"],
+                "score": float(q_scores[i]),
+                "text": filingstore.read_text(chunks[i]["sha256"], chunks[i]["start"], chunks[i]["end"]),
+            }
+            for i in best
+        ])
+    return results
+
+
+def relevant_context(company, queries, max_chars=60000, k=8):
+    """The filing chunks that best answer any of the queries, deduplicated and cut to max_chars."""
+    seen, picked, used = set(), [], 0
+    for ranked in zip(*search(company, queries, k=k)):
+        # round robin over the queries so every topic gets coverage
+        for chunk in ranked:
+            key = (chunk["year"], chunk["item"], chunk["text"][:80])
+            if key in seen or used + len(chunk["text"]) > max_chars:
+                continue
+            seen.add(key)
+            picked.append(chunk)
+            used += len(chunk["text"])
+
+    picked.sort(key=lambda c: (-int(c["year"]), c["item"]))
+    return "\n\n".join(
+        f"Source: {company} Form 10-K {c['year']}, Item {c['item']}. {tenk.ITEMS[c['item']]}\n{c['text'].strip()}"
+        for c in picked
+    )